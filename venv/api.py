@@ -0,0 +1,383 @@
+import base64
+import collections
+import datetime
+import json
+import os
+import tempfile
+import threading
+
+import falcon
+
+from listings import export_cursor, export_lines, iter_books, iter_members, member_columns, page
+from main import Admin, Book, BookSearch, Circulation, Library, Member, User
+from metrics import connection_factory, metrics
+from storage import Storage
+
+storage = Storage(os.environ.get("LIBRARY_DB", "library.sqlite"), factory=connection_factory())
+
+book_fields = ('id', 'title', 'author', 'genre', 'ISBN', 'no_of_copies')
+
+
+def book_to_dict(book_info):
+    return dict(zip(book_fields, book_info))
+
+
+def int_param(req, name, default, minimum=1, maximum=None):
+    value = req.get_param_as_int(name, min_value=minimum, max_value=maximum)
+    return default if value is None else value
+
+
+class StorageSession(object):
+
+    def process_request(self, req, resp):
+        req.context.db = storage.connection()
+
+    def process_response(self, req, resp, resource, req_succeeded):
+        storage.release()
+
+
+class CatalogCache(object):
+
+    def __init__(self, max_entries=1024):
+        self._max_entries = max_entries
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def state(db):
+        # bumped by triggers on every write to books, from any worker
+        version, modified = db.execute("SELECT version, modified FROM catalog_state WHERE id = 1").fetchone()
+        return version, datetime.datetime.fromisoformat(modified)
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, version, body):
+        with self._lock:
+            self._entries[key] = (version, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+cache = CatalogCache()
+
+
+def serve_cached(req, resp, build):
+    version, modified = cache.state(req.context.db)
+    etag = f'"catalog-{version}"'
+    resp.set_header('ETag', etag)
+    resp.cache_control = ['no-cache']
+
+    # Last-Modified only has whole seconds: advertise the second after the last
+    # write, and only once it has passed, so no later write can share it
+    last_modified = modified.replace(microsecond=0) + datetime.timedelta(seconds=1)
+    if last_modified <= datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None):
+        resp.last_modified = last_modified
+    else:
+        last_modified = None
+
+    if_none_match = req.get_header('If-None-Match')
+    if if_none_match is not None:
+        if etag in [tag.strip().replace('W/', '', 1) for tag in if_none_match.split(',')] or if_none_match.strip() == '*':
+            resp.status = falcon.HTTP_304
+            return
+    else:
+        since = req.if_modified_since
+        if since is not None and last_modified is not None and since.replace(tzinfo=None) >= last_modified:
+            resp.status = falcon.HTTP_304
+            return
+
+    key = req.relative_uri
+    body = cache.get(key, version)
+    if body is None:
+        payload = build()
+        if payload is None:
+            raise falcon.HTTPNotFound()
+        body = json.dumps(payload).encode()
+        cache.put(key, version, body)
+
+    resp.content_type = falcon.MEDIA_JSON
+    resp.data = body
+
+
+def authenticate(req, role):
+    header = req.get_header('Authorization') or ''
+    scheme, _, credentials = header.partition(' ')
+    if scheme.lower() != 'basic':
+        raise falcon.HTTPUnauthorized(title='Login required', challenges=['Basic realm="library"'])
+
+    try:
+        username, _, password = base64.b64decode(credentials).decode().partition(':')
+    except ValueError:
+        raise falcon.HTTPUnauthorized(title='Malformed credentials', challenges=['Basic realm="library"'])
+
+    user_info = req.context.db.execute("SELECT * FROM members WHERE username = ?", (username,)).fetchone()
+    if user_info is None or user_info[2] != User.hash_password(password):
+        raise falcon.HTTPUnauthorized(title='Incorrect username or password', challenges=['Basic realm="library"'])
+
+    user_id, uname, hash_passw, user_role = user_info
+    if user_role != role:
+        raise falcon.HTTPForbidden(description=f"{role} login required")
+
+    if role == 'Admin':
+        return user_id, Admin(uname, password, req.context.db)
+    return user_id, Member(uname, password, connection=req.context.db)
+
+
+def require_fields(req, *names):
+    data = req.get_media(default_when_empty=None)
+    if not isinstance(data, dict) or any(data.get(name) in (None, '') for name in names):
+        raise falcon.HTTPBadRequest(description=f"JSON body with {', '.join(names)} is required")
+    return data
+
+
+class BooksResource(object):
+
+    def on_get(self, req, resp):
+        after = int_param(req, 'after', 0, minimum=0)
+        limit = int_param(req, 'limit', 50, maximum=500)
+
+        def build():
+            books, next_after = page(iter_books(req.context.db, after, limit), limit)
+            return {'after': after, 'limit': limit, 'next_after': next_after, 'books': [book_to_dict(book) for book in books]}
+
+        serve_cached(req, resp, build)
+
+    def on_post(self, req, resp):
+        user_id, admin = authenticate(req, 'Admin')
+        data = require_fields(req, 'title', 'author', 'ISBN', 'no_of_copies')
+        try:
+            book = Book(str(data['title']), str(data['author']), str(data.get('genre') or ''), int(data['ISBN']), int(data['no_of_copies']))
+        except (TypeError, ValueError):
+            raise falcon.HTTPBadRequest(description="ISBN and no_of_copies must be integers")
+
+        if not admin.add_book_from_library(Library(req.context.db), book):
+            raise falcon.HTTPConflict(description=f"Book with ISBN {book._Isbn} already exists")
+        resp.status = falcon.HTTP_201
+        resp.media = book_to_dict((book.id, book._title, book._author, book._genre, book._Isbn, book.no_of_copies))
+
+
+class BookResource(object):
+
+    def on_get(self, req, resp, book_id):
+
+        def build():
+            book_info = req.context.db.execute("SELECT * FROM books WHERE id = ?", (book_id,)).fetchone()
+            return book_to_dict(book_info) if book_info else None
+
+        serve_cached(req, resp, build)
+
+
+class BookSearchResource(object):
+
+    def on_get(self, req, resp):
+        query = req.get_param('q', required=True)
+        page = int_param(req, 'page', 1)
+        page_size = int_param(req, 'page_size', 20, maximum=100)
+
+        def build():
+            books = BookSearch(req.context.db).search(query, page, page_size)
+            return {'q': query, 'page': page, 'page_size': page_size, 'books': [book_to_dict(book) for book in books]}
+
+        serve_cached(req, resp, build)
+
+
+class BookImportResource(object):
+
+    def on_post(self, req, resp):
+        user_id, admin = authenticate(req, 'Admin')
+        upsert = req.get_param_as_bool('upsert') or False
+
+        # populate_books_from_csv streams from a path, so spool the upload to disk
+        with tempfile.NamedTemporaryFile(mode='wb', suffix='.csv', delete=False) as file:
+            while True:
+                chunk = req.bounded_stream.read(65536)
+                if not chunk:
+                    break
+                file.write(chunk)
+        try:
+            summary = admin.populate_books_from_csv(file.name, upsert=upsert)
+        finally:
+            os.remove(file.name)
+        if summary['error'] is not None:
+            # the file couldn't be read through; rows from chunks before the error are kept
+            resp.status = falcon.HTTP_400
+        resp.media = summary
+
+
+class MembersResource(object):
+
+    def on_get(self, req, resp):
+        authenticate(req, 'Admin')
+        after = int_param(req, 'after', 0, minimum=0)
+        limit = int_param(req, 'limit', 50, maximum=500)
+        members, next_after = page(iter_members(req.context.db, after, limit), limit)
+        resp.media = {'after': after, 'limit': limit, 'next_after': next_after,
+                      'members': [dict(zip(member_columns, member)) for member in members]}
+
+    def on_post(self, req, resp):
+        user_id, admin = authenticate(req, 'Admin')
+        data = require_fields(req, 'username', 'password')
+        if not admin.add_member(str(data['username']), str(data['password'])):
+            raise falcon.HTTPConflict(description=f"Member {data['username']} already exists")
+        resp.status = falcon.HTTP_201
+        resp.media = {'username': data['username'], 'role': 'Member'}
+
+
+class MemberResource(object):
+
+    def on_put(self, req, resp, username):
+        user_id, admin = authenticate(req, 'Admin')
+        data = require_fields(req, 'username', 'password')
+        new_username = str(data['username'])
+        if new_username != username and self.username_taken(req.context.db, new_username):
+            raise falcon.HTTPConflict(description=f"Username {new_username} is already taken")
+
+        updated = admin.update_member(new_username, User.hash_password(str(data['password'])), username)
+        if updated is None:
+            # update_member prints and swallows errors; the expected one is a
+            # concurrent rename taking the name after the check above
+            if self.username_taken(req.context.db, new_username):
+                raise falcon.HTTPConflict(description=f"Username {new_username} is already taken")
+            raise falcon.HTTPInternalServerError(description=f"Member {username} could not be updated")
+        if not updated:
+            raise falcon.HTTPNotFound(description=f"Member {username} was not found")
+        resp.media = {'username': new_username}
+
+    @staticmethod
+    def username_taken(db, username):
+        return db.execute("SELECT 1 FROM members WHERE username = ?", (username,)).fetchone() is not None
+
+    def on_delete(self, req, resp, username):
+        user_id, admin = authenticate(req, 'Admin')
+        if not admin.delete_member(username):
+            raise falcon.HTTPNotFound(description=f"Member {username} was not found")
+        resp.status = falcon.HTTP_204
+
+
+class LoansResource(object):
+
+    borrow_statuses = {
+        Circulation.NOT_FOUND: falcon.HTTP_404,
+        Circulation.NO_COPIES: falcon.HTTP_409,
+        Circulation.LIMIT_REACHED: falcon.HTTP_409,
+        Circulation.ALREADY_BORROWED: falcon.HTTP_409,
+    }
+
+    def on_get(self, req, resp):
+        user_id, member = authenticate(req, 'Member')
+        books = Circulation(req.context.db).borrowed_books(user_id)
+        resp.media = [book_to_dict(book) for book in books]
+
+    def on_post(self, req, resp):
+        user_id, member = authenticate(req, 'Member')
+        data = require_fields(req, 'book_id')
+        try:
+            book_id = int(data['book_id'])
+        except (TypeError, ValueError):
+            raise falcon.HTTPBadRequest(description="book_id must be an integer")
+
+        borrow_date = Member._current_date()
+        status, book_info, due_date = Circulation(req.context.db).borrow(book_id, user_id, borrow_date)
+        if status != Circulation.BORROWED:
+            resp.status = self.borrow_statuses[status]
+            resp.media = {'status': status, 'book_id': book_id}
+            return
+
+        resp.status = falcon.HTTP_201
+        resp.media = {'status': status, 'book': book_to_dict(book_info), 'borrow_date': str(borrow_date), 'due_date': str(due_date)}
+
+
+class LoanResource(object):
+
+    def on_delete(self, req, resp, book_id):
+        user_id, member = authenticate(req, 'Member')
+        today = Member._current_date()
+        status, borrow_date = Circulation(req.context.db).return_book(book_id, user_id, today)
+
+        if status == Circulation.NOT_BORROWED:
+            resp.status = falcon.HTTP_404
+        elif status == Circulation.LATE:
+            resp.status = falcon.HTTP_409
+        resp.media = {'status': status, 'book_id': book_id, 'borrow_date': borrow_date, 'return_date': str(today)}
+
+
+class ExportResource(object):
+
+    media_types = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+    def on_get(self, req, resp, kind):
+        authenticate(req, 'Admin')
+        fmt = req.get_param('format') or 'csv'
+        since = req.get_param_as_int('since', min_value=0)
+        if kind not in ('books', 'members', 'transactions') or fmt not in self.media_types:
+            raise falcon.HTTPNotFound()
+        if kind == 'members' and since is not None:
+            raise falcon.HTTPBadRequest(description="members can only be exported in full")
+
+        cursor = export_cursor(req.context.db, kind)
+        until = cursor if since is not None else None
+
+        def stream():
+            # the body is read after StorageSession has released the request's
+            # connection, so the export takes its own for as long as it runs
+            with storage.session() as db:
+                for line in export_lines(db, kind, fmt, since, until):
+                    yield line.encode()
+
+        if cursor is not None:
+            resp.set_header('X-Export-Cursor', str(cursor))
+        resp.content_type = self.media_types[fmt]
+        resp.downloadable_as = f"{kind}.{fmt}"
+        resp.stream = stream()
+
+
+class MetricsResource(object):
+
+    # metrics are per worker process; scrape each worker or run one for exact totals
+    def on_get(self, req, resp):
+        authenticate(req, 'Admin')
+        if req.get_param('format') == 'json':
+            resp.content_type = falcon.MEDIA_JSON
+            resp.text = metrics.to_json(indent=None)
+        else:
+            resp.content_type = 'text/plain; version=0.0.4'
+            resp.text = metrics.to_prometheus()
+
+
+def create_app():
+    app = falcon.App(middleware=[StorageSession()])
+    app.add_route('/books', BooksResource())
+    app.add_route('/books/{book_id:int}', BookResource())
+    app.add_route('/books/search', BookSearchResource())
+    app.add_route('/books/import', BookImportResource())
+    app.add_route('/members', MembersResource())
+    app.add_route('/members/{username}', MemberResource())
+    app.add_route('/loans', LoansResource())
+    app.add_route('/loans/{book_id:int}', LoanResource())
+    app.add_route('/export/{kind}', ExportResource())
+    app.add_route('/metrics', MetricsResource())
+    return app
+
+
+app = create_app()
+
+
+if __name__ == '__main__':
+
+    from wsgiref.simple_server import make_server
+
+    # single-threaded development server; use gunicorn (see gunicorn.conf.py) for real traffic
+    with make_server('127.0.0.1', 8000, app) as server:
+        print("Serving on http://127.0.0.1:8000")
+        server.serve_forever()
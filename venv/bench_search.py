@@ -0,0 +1,79 @@
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import main
+from storage import Storage
+
+db = Storage(os.path.join(tempfile.mkdtemp(prefix="library_bench_"), "library.sqlite")).connection()
+
+genres = ['Fiction', 'Fantasy', 'Romance', 'Historical', 'Dystopian', 'Science Fiction', 'Cyberpunk', 'Horror', 'Drama', 'Satire', 'Classic', 'Contemporary', 'Thriller', 'Mystery']
+words = ['shadow', 'river', 'empire', 'garden', 'winter', 'silent', 'golden', 'storm', 'harbor', 'crown',
+         'forest', 'mirror', 'ember', 'paper', 'ocean', 'stone', 'night', 'glass', 'iron', 'summer']
+names = ['Ahmed', 'Rahman', 'Tolkien', 'Austen', 'Orwell', 'Huxley', 'Gibson', 'Christie', 'Hossain', 'Atwood']
+
+
+def populate(start, no_of_books):
+    rng = random.Random(42 + start)
+    rows = []
+    for i in range(start, no_of_books):
+        title = " ".join(rng.sample(words, 3)).title() + f" {i}"
+        author = f"{rng.choice(names)} {rng.choice(names)}"
+        rows.append((title, author, rng.choice(genres), 9780000000000 + i, rng.randint(0, 5)))
+
+    with db:
+        db.executemany("INSERT INTO books (title, author, genre, ISBN, no_of_copies) VALUES (?, ?, ?, ?, ?)", rows)
+
+
+# what Member.search_books used to do, widened to title/author: an unindexed
+# scan that materialises every match
+def scan_search(text):
+    pattern = f"%{text}%"
+    cursor = db.execute("SELECT * FROM books WHERE genre = ? OR title LIKE ? OR author LIKE ?",
+                             (text, pattern, pattern))
+    return cursor.fetchall()
+
+
+def timed(function, queries, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for query in queries:
+            function(query)
+    elapsed = time.perf_counter() - start
+    return elapsed / (repeat * len(queries)) * 1000
+
+
+def count_matches(text):
+    query = main.BookSearch.build_query(text)
+    if not query:
+        return 0
+    return db.execute("SELECT COUNT(*) FROM books_fts WHERE books_fts MATCH ?", (query,)).fetchone()[0]
+
+
+if __name__ == '__main__':
+
+    # e.g. "100000,1000000": the catalog is grown to each size in turn, so
+    # the table shows how latency follows the number of matches
+    sizes = [int(size) for size in (sys.argv[1] if len(sys.argv) > 1 else "100000,1000000").split(',')]
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    search = main.BookSearch(db)
+    queries = ['Horror', 'Science Fiction', 'Orwell', 'golden storm', 'harb', 'nonexistent']
+    no_of_books = 0
+
+    for size in sizes:
+        print(f"Populating {size} books...")
+        populate(no_of_books, size)
+        no_of_books = size
+
+        print(f"{'Query':<18} {'Matches':<10} {'Scan (ms)':<12} {'FTS5 (ms)':<12}")
+        for query in queries:
+            scan_ms = timed(scan_search, [query], repeat)
+            fts_ms = timed(search.search, [query], repeat)
+            print(f"{query:<18} {count_matches(query):<10} {scan_ms:<12.3f} {fts_ms:<12.3f}")
+
+        print(f"{'overall':<18} {'':<10} {timed(scan_search, queries, repeat):<12.3f} {timed(search.search, queries, repeat):<12.3f}")
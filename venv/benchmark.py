@@ -0,0 +1,295 @@
+import argparse
+import bisect
+import contextlib
+import csv
+import datetime
+import itertools
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import main
+from metrics import connection_factory
+from storage import Storage
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+genres = ['Fiction', 'Fantasy', 'Romance', 'Historical', 'Dystopian', 'Science Fiction', 'Cyberpunk', 'Horror', 'Drama', 'Satire', 'Classic', 'Contemporary', 'Thriller', 'Mystery']
+words = ['shadow', 'river', 'empire', 'garden', 'winter', 'silent', 'golden', 'storm', 'harbor', 'crown',
+         'forest', 'mirror', 'ember', 'paper', 'ocean', 'stone', 'night', 'glass', 'iron', 'summer',
+         'house', 'letter', 'king', 'daughter', 'road', 'fire', 'secret', 'island', 'war', 'song']
+first_names = ['Ahmed', 'Nusrat', 'Tanvir', 'Jane', 'George', 'Aldous', 'William', 'Agatha', 'Margaret', 'Humayun', 'Selina', 'Ursula']
+last_names = ['Rahman', 'Hossain', 'Tolkien', 'Austen', 'Orwell', 'Huxley', 'Gibson', 'Christie', 'Atwood', 'Ahmed', 'Le Guin', 'Islam']
+
+isbn_base = 9780000000000
+chunk_size = 50000
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def book_row(rng, i):
+    title = " ".join(rng.sample(words, rng.randint(2, 4))).title() + f" {i}"
+    author = f"{rng.choice(first_names)} {rng.choice(last_names)}"
+    return title, author, rng.choice(genres), isbn_base + i, rng.randint(0, 10)
+
+
+def zipf_picker(rng, n, s=1.1):
+    # a few books and members account for most of the traffic
+    cum_weights = list(itertools.accumulate(1.0 / (rank ** s) for rank in range(1, n + 1)))
+    total = cum_weights[-1]
+    order = list(range(1, n + 1))
+    rng.shuffle(order)
+    return lambda: order[bisect.bisect_left(cum_weights, rng.random() * total)]
+
+
+def generate(db, no_of_books, no_of_members, no_of_transactions, seed):
+    rng = random.Random(seed)
+
+    copies = []
+    with db:
+        for start in range(0, no_of_books, chunk_size):
+            rows = [book_row(rng, i) for i in range(start, min(start + chunk_size, no_of_books))]
+            copies.extend(row[4] for row in rows)
+            db.executemany("INSERT INTO books (title, author, genre, ISBN, no_of_copies) VALUES (?, ?, ?, ?, ?)", rows)
+
+        password = main.User.hash_password("bench")
+        for start in range(0, no_of_members, chunk_size):
+            rows = [(f"member{i}", password, 'Member') for i in range(start, min(start + chunk_size, no_of_members))]
+            db.executemany("INSERT INTO members (username, password, role) VALUES (?, ?, ?)", rows)
+
+    pick_book = zipf_picker(rng, no_of_books)
+    pick_member = zipf_picker(rng, no_of_members)
+    first_day = datetime.date.today() - datetime.timedelta(days=5 * 365)
+    # open loans follow the rules Circulation enforces: the borrow limit per
+    # member, one open loan per (member, book), and one copy taken off the shelf
+    open_loans = set()
+    open_per_member = {}
+
+    for start in range(0, no_of_transactions, chunk_size):
+        rows = []
+        for _ in range(min(chunk_size, no_of_transactions - start)):
+            member_id, book_id = pick_member(), pick_book()
+            borrow_date = first_day + datetime.timedelta(days=rng.randint(0, 5 * 365))
+            due_date = borrow_date + datetime.timedelta(days=main.Circulation.loan_days)
+            if (rng.random() < 0.002 and copies[book_id - 1] > 0 and (member_id, book_id) not in open_loans
+                    and open_per_member.get(member_id, 0) < main.Circulation.book_borrow_limit):
+                open_loans.add((member_id, book_id))
+                open_per_member[member_id] = open_per_member.get(member_id, 0) + 1
+                copies[book_id - 1] -= 1
+                rows.append((member_id, book_id, str(borrow_date), str(due_date), None))
+            else:
+                rows.append((member_id, book_id, str(borrow_date), None, str(due_date)))
+        with db:
+            db.executemany("INSERT INTO transactions (user_id, book_id, borrow_date, due_date, return_date) VALUES (?, ?, ?, ?, ?)", rows)
+
+    with db:
+        db.executemany("UPDATE books SET no_of_copies = ? WHERE id = ?",
+                       [(copies[book_id - 1], book_id) for member_id, book_id in open_loans])
+
+
+def measure(operation, iterations):
+    latencies = []
+    rss_before = peak_rss_mb()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for i in range(iterations):
+            start = time.perf_counter()
+            operation(i)
+            latencies.append(time.perf_counter() - start)
+
+    latencies.sort()
+    total = sum(latencies)
+    # ru_maxrss is a high-water mark for the whole process: report it as such,
+    # plus how far this operation pushed it (0 if an earlier one peaked higher)
+    process_peak = peak_rss_mb()
+    return {
+        'iterations': iterations,
+        'ops_per_sec': round(iterations / total, 2) if total else None,
+        'p50_ms': round(latencies[len(latencies) // 2] * 1000, 3),
+        'p99_ms': round(latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)] * 1000, 3),
+        'process_peak_rss_mb': process_peak,
+        'peak_rss_growth_mb': None if process_peak is None else round(process_peak - rss_before, 1),
+    }
+
+
+def run(db, args, scratch_dir):
+    rng = random.Random(args.seed + 1)
+    no_of_books, no_of_members = args.books, args.members
+    admin = main.Admin('bench_admin', 'bench', db)
+    library = main.Library(db)
+    members = {}
+
+    def member(member_id):
+        if member_id not in members:
+            members[member_id] = main.Member(f"member{member_id - 1}", 'bench', connection=db)
+        return members[member_id]
+
+    # new books start past the highest ISBN already stored, so a --reuse run
+    # times the same insert paths as a fresh one
+    max_isbn = db.execute("SELECT MAX(ISBN) FROM books").fetchone()[0] or isbn_base
+    first_new = max(max_isbn - isbn_base + 1, 0)
+
+    csv_path = os.path.join(scratch_dir, "bench_import.csv")
+    with open(csv_path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(['Title', 'Author', 'Genre', 'ISBN', 'No_of_Copies'])
+        for i in range(args.csv_rows):
+            writer.writerow(book_row(rng, first_new + i))
+
+    added_isbns = itertools.count(first_new + args.csv_rows)
+    # distinct ids that exist now, so every delete finds its book
+    existing_ids = [book_id for book_id, in db.execute("SELECT id FROM books")]
+    delete_ids = rng.sample(existing_ids, min(args.iterations, len(existing_ids)))
+    # keep borrowers apart so the borrow limit doesn't short-circuit the measurement
+    borrowers = itertools.cycle(range(1, no_of_members + 1))
+    loans = []
+    queries = words + [name.lower() for name in last_names] + [genre for genre in genres]
+
+    def borrow(i):
+        member_id = next(borrowers)
+        book_id = rng.randint(1, no_of_books)
+        if member(member_id).borrow_books(book_id, member_id) == main.Circulation.BORROWED:
+            loans.append((member_id, book_id))
+
+    def return_book(i):
+        if loans:
+            member_id, book_id = loans.pop()
+            member(member_id).return_books(book_id, member_id)
+
+    def show_borrow_list(i):
+        member_id = rng.randint(1, no_of_members)
+        member(member_id).show_borrowList(member_id, 'bench')
+
+    def login(i):
+        username = f"member{rng.randint(0, no_of_members - 1)}"
+        user_info = db.execute("SELECT * FROM members WHERE username = ?", (username,)).fetchone()
+        user = main.Member(user_info[1], user_info[2], connection=db)
+        user.check_password(user.hash_password('bench'))
+
+    def delete_book(i):
+        book = library.find_by_id(delete_ids[i])
+        if book is not None:
+            admin.delete_book(library, book._title)
+
+    operations = [
+        ('Library.load_books_from_db', lambda i: library.load_books_from_db(), args.load_iterations),
+        ('Admin.populate_books_from_csv', lambda i: admin.populate_books_from_csv(csv_path, upsert=True), 1),
+        ('Admin.add_book_from_library', lambda i: admin.add_book_from_library(library, main.Book(*book_row(rng, next(added_isbns)))), args.iterations),
+        ('Admin.delete_book', delete_book, len(delete_ids)),
+        ('Member.search_books', lambda i: member(1).search_books(rng.choice(queries)), args.iterations),
+        ('Member.borrow_books', borrow, args.iterations),
+        # only as many returns as borrows succeeded, so no empty iteration is timed
+        ('Member.return_books', return_book, lambda: len(loans)),
+        ('Member.show_borrowList', show_borrow_list, args.iterations),
+        ('login lookup', login, args.iterations),
+    ]
+
+    if args.only and 'Library.load_books_from_db' not in args.only:
+        # add/delete work against the in-memory catalog, so load it untimed
+        measure(lambda i: library.load_books_from_db(), 1)
+
+    results = {}
+    for name, operation, iterations in operations:
+        if args.only and name not in args.only:
+            continue
+        if callable(iterations):
+            iterations = iterations()
+        if not iterations:
+            print(f"{name:<32} skipped, nothing to do", file=sys.stderr)
+            continue
+        results[name] = measure(operation, iterations)
+        print(f"{name:<32} {results[name]['ops_per_sec']:>12} ops/sec  p50 {results[name]['p50_ms']:>9} ms  "
+              f"p99 {results[name]['p99_ms']:>9} ms", file=sys.stderr)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get('operations', {}).get(name)
+        if not before or not before.get('ops_per_sec') or not result['ops_per_sec']:
+            continue
+        change = result['ops_per_sec'] / before['ops_per_sec'] - 1
+        if change < -tolerance:
+            regressions.append({'operation': name, 'baseline_ops_per_sec': before['ops_per_sec'],
+                                'ops_per_sec': result['ops_per_sec'], 'change': round(change, 3)})
+    return regressions
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Generate a synthetic library and time every Admin/Member operation")
+    parser.add_argument('--db', help="scratch database path (default: a new temporary file)")
+    parser.add_argument('--reuse', action='store_true', help="skip data generation if --db already has books")
+    parser.add_argument('--books', type=int, default=100000)
+    parser.add_argument('--members', type=int, default=10000)
+    parser.add_argument('--transactions', type=int, default=1000000)
+    parser.add_argument('--csv-rows', type=int, default=50000, help="rows in the generated CSV import")
+    parser.add_argument('--iterations', type=int, default=200, help="iterations per operation")
+    parser.add_argument('--load-iterations', type=int, default=3, help="iterations of load_books_from_db")
+    parser.add_argument('--only', nargs='*', help="run only these operations")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="write the JSON report here instead of stdout")
+    parser.add_argument('--baseline', help="earlier JSON report to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="allowed ops/sec drop before flagging a regression")
+    args = parser.parse_args()
+
+    scratch_dir = tempfile.mkdtemp(prefix="library_benchmark_")
+    db_path = args.db or os.path.join(scratch_dir, "library.sqlite")
+    # same connections as the app, so LIBRARY_METRICS=0/1 runs show the tracing cost
+    storage = Storage(db_path, factory=connection_factory())
+    db = storage.connection()
+
+    generation_seconds = None
+    if not (args.reuse and db.execute("SELECT 1 FROM books LIMIT 1").fetchone()):
+        print(f"Generating {args.books} books, {args.members} members and {args.transactions} transactions into {db_path}...", file=sys.stderr)
+        start = time.perf_counter()
+        generate(db, args.books, args.members, args.transactions, args.seed)
+        generation_seconds = round(time.perf_counter() - start, 2)
+    else:
+        args.books = db.execute("SELECT MAX(id) FROM books").fetchone()[0]
+        args.members = db.execute("SELECT COUNT(*) FROM members").fetchone()[0]
+
+    # what is actually in the database, which for --reuse is not what the flags say
+    dataset = {table: db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+               for table in ('books', 'members', 'transactions')}
+    dataset.update({'seed': args.seed, 'generation_seconds': generation_seconds})
+
+    report = {
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'dataset': dataset,
+        'operations': run(db, args, scratch_dir),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+    storage.close_all()
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as file:
+            report['regressions'] = compare(report['operations'], json.load(file), args.tolerance)
+        exit_code = 1 if report['regressions'] else 0
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(output)
+    else:
+        print(output)
+    sys.exit(exit_code)
@@ -0,0 +1,9 @@
+import multiprocessing
+import os
+
+# gunicorn -c gunicorn.conf.py api:app
+bind = os.environ.get("LIBRARY_BIND", "127.0.0.1:8000")
+workers = int(os.environ.get("LIBRARY_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get("LIBRARY_THREADS", 1))
+keepalive = 5
+accesslog = None
@@ -0,0 +1,160 @@
+import csv
+import heapq
+import io
+import itertools
+import json
+
+book_columns = ('id', 'title', 'author', 'genre', 'ISBN', 'no_of_copies')
+member_columns = ('id', 'username', 'role')
+transaction_columns = ('id', 'user_id', 'book_id', 'borrow_date', 'due_date', 'return_date')
+book_change_columns = ('seq', 'changed_at', 'deleted') + book_columns
+transaction_change_columns = ('seq',) + transaction_columns
+export_kinds = ('books', 'members', 'transactions')
+export_formats = ('csv', 'jsonl')
+
+
+def iter_batches(connection, query, after, bounds=(), batch_size=1000, key_index=0):
+    # keyset pagination: each batch is a short indexed range scan, so no read
+    # transaction is held open between batches and memory stays constant.
+    # bounds are bound as parameters so each query text stays in the statement cache
+    while True:
+        rows = connection.execute(query, (after,) + tuple(bounds) + (batch_size,)).fetchall()
+        yield from rows
+        if len(rows) < batch_size:
+            return
+        after = rows[-1][key_index]
+
+
+def iter_rows(connection, table, columns, after_id=0, until_id=None, batch_size=1000, key='id'):
+    query = f"SELECT {', '.join(columns)} FROM {table} WHERE {key} > ?"
+    bounds = ()
+    if until_id is not None:
+        query += f" AND {key} <= ?"
+        bounds = (until_id,)
+    query += f" ORDER BY {key} LIMIT ?"
+    return iter_batches(connection, query, after_id, bounds, batch_size, columns.index(key))
+
+
+def iter_books(connection, after_id=0, batch_size=1000):
+    return iter_rows(connection, 'books', book_columns, after_id, batch_size=batch_size)
+
+
+def iter_members(connection, after_id=0, batch_size=1000):
+    return iter_rows(connection, 'members', member_columns, after_id, batch_size=batch_size)
+
+
+def iter_transactions(connection, after_id=0, until_id=None, batch_size=1000):
+    return iter_rows(connection, 'transactions', transaction_columns, after_id, until_id, batch_size)
+
+
+def iter_book_changes(connection, since=0, until=None, batch_size=1000):
+    # book_changes holds one row per book, re-sequenced by triggers on every
+    # insert, update and delete; deleted books come back as tombstones
+    columns = ('book_changes.seq', 'book_changes.changed_at', 'book_changes.deleted', 'book_changes.book_id',
+               'books.title', 'books.author', 'books.genre', 'books.ISBN', 'books.no_of_copies')
+    query = (f"SELECT {', '.join(columns)} FROM book_changes LEFT JOIN books ON books.id = book_changes.book_id "
+             "WHERE book_changes.seq > ?")
+    bounds = ()
+    if until is not None:
+        query += " AND book_changes.seq <= ?"
+        bounds = (until,)
+    query += " ORDER BY book_changes.seq LIMIT ?"
+    return iter_batches(connection, query, since, bounds, batch_size)
+
+
+def iter_transaction_changes(connection, since=0, until=None, batch_size=1000):
+    # loans added after `since`, in their current state, merged in cursor order
+    # with the returns of loans added up to `since` (see transaction_returns)
+    new_loans = ((row[0],) + row for row in iter_transactions(connection, since, until, batch_size))
+
+    columns = ['transaction_returns.seq'] + [f"transactions.{column}" for column in transaction_columns]
+    query = (f"SELECT {', '.join(columns)} FROM transaction_returns "
+             "INNER JOIN transactions ON transactions.id = transaction_returns.transaction_id "
+             "WHERE transaction_returns.seq > ? AND transaction_returns.transaction_id <= ?")
+    bounds = (since,)
+    if until is not None:
+        query += " AND transaction_returns.seq <= ?"
+        bounds += (until,)
+    query += " ORDER BY transaction_returns.seq LIMIT ?"
+    returns = iter_batches(connection, query, since, bounds, batch_size)
+
+    return heapq.merge(new_loans, returns, key=lambda row: row[0])
+
+
+def page(rows_iterator, limit):
+    # one page from any of the iterators above, plus the cursor for the next one
+    rows = []
+    for row in rows_iterator:
+        rows.append(row)
+        if len(rows) == limit:
+            break
+    next_after = rows[-1][0] if len(rows) == limit else None
+    return rows, next_after
+
+
+def export_cursor(connection, kind):
+    if kind == 'books':
+        return connection.execute("SELECT COALESCE(MAX(seq), 0) FROM book_changes").fetchone()[0]
+    if kind == 'transactions':
+        row = connection.execute("SELECT seq FROM sqlite_sequence WHERE name = 'transactions'").fetchone()
+        return row[0] if row else 0
+    return None
+
+
+def check_export(kind, fmt='csv', since=None):
+    if kind not in export_kinds:
+        raise ValueError(f"Unknown export {kind}, expected books, members or transactions")
+    if fmt not in export_formats:
+        raise ValueError(f"Unknown format {fmt}, expected csv or jsonl")
+    if kind == 'members' and since is not None:
+        raise ValueError("members can only be exported in full")
+
+
+def export_rows(connection, kind, since=None, until=None, batch_size=1000):
+    check_export(kind, since=since)
+    if kind == 'books':
+        if since is None:
+            return book_columns, iter_books(connection, batch_size=batch_size)
+        return book_change_columns, iter_book_changes(connection, since, until, batch_size)
+    if kind == 'transactions':
+        if since is None:
+            return transaction_columns, iter_transactions(connection, batch_size=batch_size)
+        return transaction_change_columns, iter_transaction_changes(connection, since, until, batch_size)
+    return member_columns, iter_members(connection, batch_size=batch_size)
+
+
+def export_lines(connection, kind, fmt='csv', since=None, until=None, batch_size=1000):
+    columns, rows = export_rows(connection, kind, since, until, batch_size)
+
+    if fmt == 'jsonl':
+        for row in rows:
+            yield json.dumps(dict(zip(columns, row))) + "\n"
+    elif fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        # hand back one record at a time so nothing accumulates in the buffer
+        for row in itertools.chain([None], rows):
+            if row is not None:
+                writer.writerow(row)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    else:
+        raise ValueError(f"Unknown format {fmt}, expected csv or jsonl")
+
+
+def export(connection, kind, path, fmt='csv', since=None, batch_size=1000):
+    # export_lines is a generator, so validate before the file is truncated
+    check_export(kind, fmt, since)
+    # the cursor is taken before reading, so changes made while exporting are
+    # picked up by the next incremental run instead of being missed
+    cursor = export_cursor(connection, kind)
+    rows = 0
+    with open(path, 'w', encoding='utf-8', newline='') as file:
+        for line in export_lines(connection, kind, fmt, since, cursor if since is not None else None, batch_size):
+            file.write(line)
+            rows += 1
+    if fmt == 'csv':
+        rows -= 1
+    return {'rows': rows, 'cursor': cursor}
@@ -0,0 +1,151 @@
+import argparse
+import base64
+import csv
+import http.client
+import io
+import json
+import random
+import threading
+import time
+import urllib.parse
+
+
+def auth_header(credentials):
+    return {'Authorization': 'Basic ' + base64.b64encode(credentials.encode()).decode()}
+
+
+class Client(object):
+
+    def __init__(self, url):
+        parts = urllib.parse.urlsplit(url)
+        self._host = parts.hostname
+        self._port = parts.port or 80
+        self._connection = None
+
+    def request(self, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+
+        for attempt in range(2):
+            if self._connection is None:
+                self._connection = http.client.HTTPConnection(self._host, self._port, timeout=30)
+            try:
+                self._connection.request(method, path, body=body, headers=headers)
+                response = self._connection.getresponse()
+                return response.status, response.read()
+            except (http.client.HTTPException, OSError):
+                # the server closed a keep-alive connection, reconnect once
+                self._connection.close()
+                self._connection = None
+                if attempt:
+                    raise
+
+
+def seed(url, admin, member, no_of_books):
+    client = Client(url)
+    username, _, password = member.partition(':')
+    client.request('POST', '/members', {'username': username, 'password': password}, auth_header(admin))
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(['Title', 'Author', 'Genre', 'ISBN', 'No_of_Copies'])
+    genres = ['Fiction', 'Fantasy', 'Romance', 'Horror', 'Mystery', 'Thriller']
+    for i in range(no_of_books):
+        writer.writerow([f"Load Test Book {i}", f"Author {i % 97}", genres[i % len(genres)], 8800000000000 + i, 1000])
+    status, body = client.request('POST', '/books/import', buffer.getvalue(),
+                                  dict(auth_header(admin), **{'Content-Type': 'text/csv'}))
+    print(f"Seeded catalog: {status} {body.decode()}")
+
+
+def endpoints(args):
+    admin = auth_header(args.admin)
+    member = auth_header(args.member)
+    words = ['load', 'test', 'book', 'author', 'fiction', 'horror', 'myst']
+
+    def borrow_and_return(client, rng):
+        book_id = rng.randint(1, args.max_book_id)
+        status, _ = client.request('POST', '/loans', {'book_id': book_id}, member)
+        if status == 201:
+            status, _ = client.request('DELETE', f'/loans/{book_id}', headers=member)
+        return status
+
+    return {
+        'GET /books': lambda client, rng: client.request('GET', f'/books?after={rng.randint(0, 20) * 50}')[0],
+        'GET /books/{id}': lambda client, rng: client.request('GET', f'/books/{rng.randint(1, args.max_book_id)}')[0],
+        'GET /books/search': lambda client, rng: client.request('GET', f'/books/search?q={rng.choice(words)}')[0],
+        'GET /loans': lambda client, rng: client.request('GET', '/loans', headers=member)[0],
+        'GET /members': lambda client, rng: client.request('GET', '/members', headers=admin)[0],
+        'POST+DELETE /loans': borrow_and_return,
+    }
+
+
+def run_endpoint(url, operation, no_of_requests, concurrency):
+    latencies = [[] for _ in range(concurrency)]
+    statuses = [{} for _ in range(concurrency)]
+    per_thread = max(no_of_requests // concurrency, 1)
+
+    def worker(index):
+        client = Client(url)
+        rng = random.Random(index)
+        for _ in range(per_thread):
+            start = time.perf_counter()
+            try:
+                status = operation(client, rng)
+            except Exception:
+                status = 'error'
+            latencies[index].append(time.perf_counter() - start)
+            statuses[index][status] = statuses[index].get(status, 0) + 1
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    samples = sorted(latency for thread_latencies in latencies for latency in thread_latencies)
+    totals = {}
+    for thread_statuses in statuses:
+        for status, count in thread_statuses.items():
+            totals[status] = totals.get(status, 0) + count
+    errors = sum(count for status, count in totals.items() if status == 'error' or status >= 500)
+
+    return {
+        'requests': len(samples),
+        'errors': errors,
+        'statuses': {str(status): count for status, count in totals.items()},
+        'requests_per_sec': round(len(samples) / elapsed, 1),
+        'p50_ms': round(samples[len(samples) // 2] * 1000, 2),
+        'p99_ms': round(samples[min(int(len(samples) * 0.99), len(samples) - 1)] * 1000, 2),
+    }
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Load test a running library API, e.g. gunicorn -c gunicorn.conf.py api:app")
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--admin', default='admin:admin', help="username:password of an existing admin")
+    parser.add_argument('--member', default='loadtest:loadtest', help="username:password of the member to borrow as")
+    parser.add_argument('--requests', type=int, default=2000, help="requests per endpoint")
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--max-book-id', type=int, default=1000)
+    parser.add_argument('--seed-books', type=int, default=0, help="import this many books and create the member first")
+    parser.add_argument('--json', action='store_true', help="print the report as JSON")
+    args = parser.parse_args()
+
+    if args.seed_books:
+        seed(args.url, args.admin, args.member, args.seed_books)
+
+    report = {}
+    for name, operation in endpoints(args).items():
+        report[name] = run_endpoint(args.url, operation, args.requests, args.concurrency)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{'Endpoint':<22} {'Requests':<10} {'Errors':<8} {'Req/sec':<10} {'p50 (ms)':<10} {'p99 (ms)':<10}")
+        for name, result in report.items():
+            print(f"{name:<22} {result['requests']:<10} {result['errors']:<8} {result['requests_per_sec']:<10} {result['p50_ms']:<10} {result['p99_ms']:<10}")
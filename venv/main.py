@@ -0,0 +1,972 @@
+import contextlib
+import csv
+import sqlite3
+import pytz
+import datetime
+import hashlib
+import itertools
+import os
+import re
+import time
+
+from listings import export, iter_books, iter_members, page
+from metrics import connection_factory, instrument_methods, metrics
+from reports import Reports
+from storage import Storage
+
+storage = Storage("library.sqlite", factory=connection_factory())
+
+
+class User(object):
+
+    def __init__(self, username, password, role = 'Member', connection=None):
+        self._db = connection if connection is not None else storage.connection()
+        self._username = username
+        self.__password = self.hash_password(password)
+        self._role = role
+
+    @staticmethod
+    def hash_password(password):
+        return hashlib.sha256(password.encode()).hexdigest()
+    
+    def check_password(self, password):
+        return self.__password == self.hash_password(password)
+
+    def get_role(self):
+        return self._role
+    
+    def get_password(self):
+        return self.__password
+
+
+
+@instrument_methods()
+class Admin(User):
+
+    def __init__(self, username, password, connection=None):
+        super().__init__(username, password, role='Admin', connection=connection)
+
+
+    def insert_into_db(self):
+
+        try:
+            self._db.execute("INSERT INTO members (username, password, role) VALUES (?, ?, ?)", (self._username, self.get_password(), self._role ))
+            self._db.commit()
+            print(f"Admin {self._username} Registered successfully!.")
+
+        except sqlite3.IntegrityError as e:
+            print(f"Error: Admin {self._username} already exists.: {e}")
+        except Exception as e:
+            print(f"Error: {e}")
+
+    
+    def add_member(self, username, password):
+
+        try:
+            member = Member(username, password, connection=self._db)
+            self._db.execute("INSERT INTO members (username, password, role) VALUES (?, ?, ?)", (member._username, member.get_password(), member._role))
+            self._db.commit()
+            print(f"Member {member._username} has been added successfully!")
+            return True
+
+        except sqlite3.IntegrityError as e:
+            print(f"Error: {e}")
+        except Exception as e:
+            print(f"Error: {e}")
+
+
+    def delete_member(self, username):
+
+        try:
+            cursor = self._db.execute("DELETE FROM members WHERE username = ?", (username,))
+            self._db.commit()
+            if cursor.rowcount == 0:
+                print(f"Member {username} was not found!")
+                return False
+            print(f"Member {username} has been removed!")
+            return True
+        except sqlite3.IntegrityError as e:
+            print(f"Error: {e}")
+        except Exception as e:
+            print(f"Error: {e}")
+
+    
+    def update_member(self,new_username, new_password, username):
+
+        try:
+            cursor = self._db.execute("UPDATE members SET username = ?, password = ? WHERE username = ?",(new_username, new_password, username))
+            self._db.commit()
+            if cursor.rowcount == 0:
+                print(f"Member {username} was not found!")
+                return False
+            print(f"Member {username}'s information updated successfully!")
+            return True
+        except sqlite3.IntegrityError as e:
+            print(f"Error: {e}")
+        except Exception as e:
+            print(f"Error: {e}")
+
+    
+    def show_all_members(self):
+
+        try:
+            print(f"{'ID':<5} {'Name':<15} {'Role':<12}")
+            
+            for users in iter_members(self._db):
+                id, name, role = users
+                print(f"{id:<5} {name:<15} {role:<12}")
+        except sqlite3.IntegrityError as e:
+            print(f"Error finding members!: {e}")
+        except Exception as e:
+            print(f"Error: {e}")
+
+
+    def add_book_from_library(self, library, book):
+
+        if library.find_by_isbn(book._Isbn) is not None:
+            print(f"Book {book._title} already exists!")
+            return False
+
+        try:
+            cursor = self._db.execute("INSERT INTO books (title, author, genre, ISBN, no_of_copies) VALUES (?, ?, ?, ?, ?)", (book._title, book._author, book._genre, book._Isbn, book.no_of_copies))
+            self._db.commit()
+            print(f"Book {book._title} has been added successfully to the database!")
+
+            book.id = cursor.lastrowid
+            library.addBook_to_BookList(book)
+            print(f"Book {book._title} has been added to the Book list!")
+            return True
+
+        except sqlite3.IntegrityError as e:
+           print(f"Error during adding book {book._title}: {e}")
+        except Exception as e:
+            print(f"Error: {e}")
+
+
+    def delete_book(self, library, book_title):
+
+        books_to_remove = library.find_by_title(book_title)
+
+        if books_to_remove:
+            try:
+                self._db.execute("DELETE FROM books WHERE title = ?", (book_title,))
+                self._db.commit()
+                print(f"Book {book_title} removed successfully from database!")
+
+                for book in books_to_remove:
+                    library.deleteBook_from_BookList(book)
+                print(f"Book {book_title} removed from book list also!")
+
+            except sqlite3.IntegrityError as e:
+                print(f"Error during deletion of book {book_title}: {e}")
+            except Exception as e:
+                print(f"Error: {e}")
+        else:
+            print(f"Book {book_title} was not found in book list!")
+
+
+
+    def update_book_info(self, library, book_title):
+
+        books_to_update = library.find_by_title(book_title)
+
+        if books_to_update:
+            book_to_update = books_to_update[0]
+            try:
+                title2 = str(input("Enter new title of the book: "))
+                author2 = str(input("Enter new author name: "))
+                genre2 = str(input("Enter new genre type: "))
+                no_of_copies2 = int(input("Enter new no. of copies: "))
+
+                cursor = self._db.execute("UPDATE books SET title = ?, author = ?, genre = ?, no_of_copies = ? WHERE id = ?", (title2, author2, genre2, no_of_copies2, book_to_update.id))
+                self._db.commit()
+
+                if cursor.rowcount == 0:
+                    library.deleteBook_from_BookList(book_to_update)
+                    print(f"Book {book_title} was not found")
+                else:
+                    print(f"Book {book_title}'s information updated successfully!")
+
+                    library.update_book(book_to_update, title2, author2, genre2, no_of_copies2)
+                    print(f"Book {book_title}'s information updated in book list also!")
+
+            except sqlite3.IntegrityError as e:
+                print(f"Error during updating book {book_title}: {e}")
+            except Exception as e:
+                print(f"Error: {e}")
+        else:
+            print(f"Book {book_title} was not found in the book list!")
+
+
+    def show_all_books(self, after_id=0, limit=50):
+        next_after = None
+        try:
+            book_info, next_after = page(iter_books(self._db, after_id, limit), limit)
+            print(f"{'ID':<5} {'Title':<30} {'Author':<20} {'Genre':<18} {'ISBN':<18} {'No. of copies':<10}")
+            
+            for book in book_info:
+                id,title, author, genre, Isbn, no_of_copies = book
+                print(f"{id:<5} {title:<30} {author:<20} {genre:<18} {Isbn:<18} {no_of_copies:<10}")
+        except sqlite3.IntegrityError as e:
+            print(f"Error showing books!: {e}")
+        except Exception as e:
+            print(f"Error: {e}")
+        return next_after
+
+
+    def export_data(self, kind, path, fmt='csv', since=None):
+
+        try:
+            summary = export(self._db, kind, path, fmt, since)
+            print(f"Exported {summary['rows']} {kind} rows to {path}. Use {summary['cursor']} as the 'since' value for the next incremental export.")
+            return summary
+        except ValueError as e:
+            print(f"Error: {e}")
+        except OSError as e:
+            print(f"Error writing export file!: {e}")
+        except Exception as e:
+            print(f"Error: {e}")
+
+    
+    def show_reports(self, as_of, limit=10):
+
+        try:
+            reports = Reports(self._db)
+
+            overdue_loans = reports.overdue_loans(as_of, limit)
+            print(f"Overdue loans as of {as_of}:")
+            print(f"{'Member':<15} {'Book ID':<8} {'Title':<30} {'Borrowed':<12} {'Due':<12}")
+            for id, user_id, username, book_id, title, borrow_date, due_date in overdue_loans:
+                print(f"{username:<15} {book_id:<8} {title:<30} {borrow_date:<12} {due_date:<12}")
+
+            print("Most borrowed books:")
+            print(f"{'ID':<5} {'Title':<30} {'Author':<20} {'Genre':<18} {'Borrowed':<8}")
+            for id, title, author, genre, borrow_count in reports.most_borrowed_books(limit):
+                print(f"{id:<5} {title:<30} {author:<20} {genre or '-':<18} {borrow_count:<8}")
+
+            print("Most borrowed genres:")
+            for genre, borrow_count in reports.most_borrowed_genres(limit):
+                print(f"{genre or '-':<18} {borrow_count:<8}")
+        except Exception as e:
+            print(f"Error: {e}")
+
+
+    def populate_books_from_csv(self, csv_path, chunk_size=5000, upsert=False, library=None):
+
+        summary = {'inserted': 0, 'updated': 0, 'skipped': 0, 'failed': 0, 'rows_per_sec': 0.0, 'errors': [], 'error': None}
+        start = time.perf_counter()
+        try:
+            known_isbns = set()
+            known_titles = set()
+            for title, Isbn in self._db.execute("SELECT title, ISBN FROM books"):
+                known_titles.add(title)
+                known_isbns.add(Isbn)
+
+            with open(csv_path, mode='r', encoding='utf-8', newline='') as file:
+                reader = csv.DictReader(file)
+                while True:
+                    chunk = list(itertools.islice(reader, chunk_size))
+                    if not chunk:
+                        break
+
+                    new_books = []
+                    copies_updates = []
+                    for row in chunk:
+                        try:
+                            title = row['Title'].strip()
+                            author = row['Author'].strip()
+                            genre = row['Genre'].strip()
+                            Isbn = int(row['ISBN'])
+                            no_of_copies = int(row['No_of_Copies'])
+                        except (KeyError, AttributeError, TypeError, ValueError) as e:
+                            self._import_failed(summary, row.get('Title'), f"invalid row: {e}")
+                            continue
+
+                        if not title or not author:
+                            self._import_failed(summary, title, "title and author are required")
+                        elif Isbn in known_isbns:
+                            if upsert:
+                                copies_updates.append((no_of_copies, Isbn))
+                            else:
+                                summary['skipped'] += 1
+                        elif title in known_titles:
+                            summary['skipped'] += 1
+                        else:
+                            new_books.append((title, author, genre, Isbn, no_of_copies))
+                            known_isbns.add(Isbn)
+                            known_titles.add(title)
+
+                    self._import_chunk(new_books, copies_updates, summary, library)
+
+        except FileNotFoundError as e:
+            print(f"CSV file not found. Please check the file path.: {e}")
+            summary['error'] = f"CSV file not found: {e}"
+        except Exception as e:
+            print(f"Error: {e}")
+            summary['error'] = str(e)
+
+        elapsed = time.perf_counter() - start
+        processed = summary['inserted'] + summary['updated'] + summary['skipped'] + summary['failed']
+        if elapsed > 0:
+            summary['rows_per_sec'] = round(processed / elapsed, 1)
+
+        print(f"CSV import finished: {summary['inserted']} inserted, {summary['updated']} updated, "
+              f"{summary['skipped']} skipped, {summary['failed']} failed ({summary['rows_per_sec']} rows/sec)")
+        if summary['failed'] > len(summary['errors']):
+            print(f"First {len(summary['errors'])} failures:")
+        for error in summary['errors']:
+            print(f"  {error['title']}: {error['error']}")
+        return summary
+
+
+    @staticmethod
+    def _import_failed(summary, title, error, max_errors=20):
+        # only the first few reasons are kept so a bad file can't grow the summary without bound
+        summary['failed'] += 1
+        if len(summary['errors']) < max_errors:
+            summary['errors'].append({'title': title, 'error': error})
+
+
+    def _import_chunk(self, new_books, copies_updates, summary, library=None):
+
+        insert_sql = "INSERT INTO books (title, author, genre, ISBN, no_of_copies) VALUES (?, ?, ?, ?, ?)"
+        update_sql = "UPDATE books SET no_of_copies = ? WHERE ISBN = ?"
+        try:
+            with self._db:
+                last_id = self._db.execute("SELECT COALESCE(MAX(id), 0) FROM books").fetchone()[0]
+                self._db.executemany(insert_sql, new_books)
+                self._db.executemany(update_sql, copies_updates)
+                if library is not None:
+                    library.sync_new_books(last_id)
+            summary['inserted'] += len(new_books)
+            summary['updated'] += len(copies_updates)
+
+        except sqlite3.IntegrityError:
+            # the batch was rolled back, replay it row by row to isolate the bad rows
+            with self._db:
+                for values in new_books:
+                    try:
+                        self._db.execute(insert_sql, values)
+                        summary['inserted'] += 1
+                    except sqlite3.IntegrityError as e:
+                        self._import_failed(summary, values[0], str(e))
+                for values in copies_updates:
+                    self._db.execute(update_sql, values)
+                    summary['updated'] += 1
+                if library is not None:
+                    library.sync_new_books(last_id)
+
+        if library is not None:
+            for no_of_copies, Isbn in copies_updates:
+                book = library.find_by_isbn(Isbn)
+                if book is not None:
+                    book.no_of_copies = no_of_copies
+
+
+
+@instrument_methods()
+class Member(User):
+
+    def __init__(self, username, password, role='Member', connection=None):
+        super().__init__(username, password, role, connection)
+        self.borrow_list = []
+        self.return_list = []
+        self._circulation = Circulation(self._db)
+    
+    @staticmethod
+    def _current_date():
+        bd_timezone = pytz.timezone('Asia/Dhaka')
+        current_date = datetime.datetime.now(bd_timezone).date()
+        return current_date
+    
+    def load_borrowed_books(self, member_id):
+
+        self.borrow_list.clear()
+        try:
+            borrowed_books = self._circulation.borrowed_books(member_id)
+
+            if not borrowed_books :
+                print("Borrow list is empty!")
+            else:
+                print(f"{'ID':<5} {'Title':<30} {'Author':<20} {'Genre':<18} {'ISBN':<18}")
+                for book in borrowed_books:
+                    id, title, author, genre, Isbn, no_of_copies = book
+                    book = Book(title, author, genre, Isbn, no_of_copies, id)
+                    self.borrow_list.append((id, book))
+        
+        except sqlite3.IntegrityError as e:
+            print(f"Error: loading books-{e}")
+        except Exception as e:
+            print(f"Error: {e}")
+
+
+    def search_books(self, book_choice, page=1, page_size=20):
+
+        book_info = []
+        try:
+            book_info = BookSearch(self._db).search(book_choice, page, page_size)
+
+            if len(book_info) == 0:
+                print(f"Sorry, no result found for {book_choice}! Try different keywords!")
+            else:
+                print(f"Available Books for {book_choice} (page {page}):")
+                print(f"{'ID':<5} {'Title':<40} {'Author':<35} {'Genre':<18} {'ISBN':<18} {'Copies':<5}")
+
+                for book in book_info:
+                    id, title, author, genre, Isbn, no_of_copies = book
+                    print(f"{id:<5} {title:<40} {author:<35} {genre:<18} {Isbn:<18} {no_of_copies:<5}")
+        except sqlite3.OperationalError as e:
+            print(f"Error searching books!: {e}")
+        except Exception as e:
+            print(f"Error: {e}")
+        return book_info
+
+
+    def borrow_books(self, book_id, member_id):
+
+        try:
+            borrow_date = self._current_date()
+            status, book_info, due_date = self._circulation.borrow(book_id, member_id, borrow_date)
+
+            if status == Circulation.NOT_FOUND:
+                print(f"Book with ID {book_id} is not available right now!")
+            elif status == Circulation.LIMIT_REACHED:
+                print(f"You have reached your borrow limit of {Circulation.book_borrow_limit} books. Please return a book to borrow more.")
+            elif status == Circulation.ALREADY_BORROWED:
+                print(f"Sorry, you have already borrowed this book")
+            elif status == Circulation.NO_COPIES:
+                print("Sorry, no copies available!")
+            else:
+                id, title, author, genre, Isbn, no_of_copies = book_info
+
+                print(f"Book found with ID {id}")
+                print(f"{'ID':<5} {'Title':<30} {'Author':<20} {'Genre':<18} {'ISBN':<18} {'No. of copies':<10}")
+                print(f"{id:<5} {title:<30} {author:<20} {genre:<18} {Isbn:<18} {no_of_copies:<10}")
+                print(f"Borrow successful..")
+
+                book = Book(title, author, genre, Isbn, no_of_copies, id)
+                self.borrow_list.append((id, book))
+
+                print(f"You borrowed Book {title} on {borrow_date}, Please return it within {due_date}")
+                print("Thank you for borrowing this book, it's a great book to read. Happy Reading!")
+            return status
+
+        except sqlite3.IntegrityError as e:
+            print(f"Error during borrowing book with ID {book_id}: {e}")
+        except Exception as e:
+            print(f"Error: {e}")
+
+
+
+    def return_books(self, book_id, member_id):
+
+        try:
+            today = self._current_date()
+            status, borrow_date = self._circulation.return_book(book_id, member_id, today)
+
+            if status == Circulation.NOT_BORROWED:
+                print(f"You did not borrow any book with ID {book_id}")
+            elif status == Circulation.LATE:
+                print(f"You are returning this book late!")
+            else:
+                print(f"You borrowed this book with ID {book_id} on {borrow_date}")
+
+                for borrowed in self.borrow_list:
+                    if borrowed[0] == book_id:
+                        self.borrow_list.remove(borrowed)
+                        self.return_list.append(borrowed)
+                        break
+                print(f"Book with ID {book_id} has been returned and number of copies updated!")
+            return status
+
+        except sqlite3.IntegrityError as e:
+            print(f"Error during returning book with ID {book_id}: {e}")
+        except Exception as e:
+            print(f"Error! exception occurred: {e}")
+
+
+    def show_all_books(self, after_id=0, limit=50):
+
+        print("Available Books: ")
+        next_after = None
+        try:
+            book_info, next_after = page(iter_books(self._db, after_id, limit), limit)
+
+            print(f"{'ID':<5} {'Title':<40} {'Author':<25} {'Genre':<18} {'ISBN':<18} {'No. of copies':<10}")
+            for book in book_info:
+                id,title, author, genre, Isbn, no_of_copies = book
+                print(f"{id:<5} {title:<40} {author:<25} {genre:<18} {Isbn:<18} {no_of_copies:<10}")
+        except sqlite3.IntegrityError as e:
+            print(f"Error showing books!: {e}")
+        except Exception as e:
+            print(f"Error: {e}")
+        return next_after
+    
+    def show_borrowList(self, member_id, member_name):
+
+        try:
+            print("Borrow List: ")
+            self.load_borrowed_books(member_id)
+
+            for id, book in self.borrow_list: 
+                        print(f"{id:<5} {book._title:<30} {book._author:<20} {book._genre:<18} {book._Isbn:<18}")
+
+            print(f"Loaded {len(self.borrow_list)} books in borrow list for member {member_name} with ID {member_id}")
+        except sqlite3.IntegrityError as e:
+            print(f"Error: showing borrowlist- {e}")
+        except Exception as e:
+            print(f"Error: {e}")    
+
+
+    def show_history(self, member_id, limit=20):
+
+        try:
+            history = Reports(self._db).member_history(member_id, limit)
+            if not history:
+                print("You have not borrowed any books yet!")
+                return
+
+            print(f"{'Book ID':<8} {'Title':<30} {'Borrowed':<12} {'Due':<12} {'Returned':<12}")
+            for id, book_id, title, borrow_date, due_date, return_date in history:
+                print(f"{book_id:<8} {title or '-':<30} {borrow_date:<12} {due_date or '-':<12} {return_date or '-':<12}")
+        except Exception as e:
+            print(f"Error: {e}")
+
+
+
+@instrument_methods()
+class Circulation(object):
+
+    book_borrow_limit = 3
+    loan_days = 7
+
+    BORROWED = 'borrowed'
+    NOT_FOUND = 'not_found'
+    NO_COPIES = 'no_copies'
+    LIMIT_REACHED = 'limit_reached'
+    ALREADY_BORROWED = 'already_borrowed'
+    RETURNED = 'returned'
+    NOT_BORROWED = 'not_borrowed'
+    LATE = 'late'
+
+    def __init__(self, connection=None):
+        self._db = connection if connection is not None else storage.connection()
+
+    @contextlib.contextmanager
+    def _write_transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front, so the checks and the
+        # writes below can't interleave with another borrower's
+        if self._db.in_transaction:
+            self._db.commit()
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._db.rollback()
+            raise
+        else:
+            self._db.commit()
+
+    def borrowed_books(self, member_id):
+        cursor = self._db.execute("SELECT books.id, books.title, books.author, books.genre, books.ISBN, books.no_of_copies FROM transactions "
+                                  " INNER JOIN books ON transactions.book_id = books.id "
+                                  " WHERE transactions.user_id = ? AND transactions.due_date is not NULL", (member_id,))
+        return cursor.fetchall()
+
+    def borrow(self, book_id, member_id, borrow_date):
+        due_date = borrow_date + datetime.timedelta(days=self.loan_days)
+
+        with self._write_transaction():
+            loans = self._db.execute("SELECT book_id FROM transactions WHERE user_id = ? AND due_date is not NULL", (member_id,)).fetchall()
+            if any(loan[0] == book_id for loan in loans):
+                return Circulation.ALREADY_BORROWED, None, None
+            if len(loans) >= self.book_borrow_limit:
+                return Circulation.LIMIT_REACHED, None, None
+
+            cursor = self._db.execute("UPDATE books SET no_of_copies = no_of_copies - 1 WHERE id = ? AND no_of_copies > 0", (book_id,))
+            if cursor.rowcount == 0:
+                exists = self._db.execute("SELECT 1 FROM books WHERE id = ?", (book_id,)).fetchone()
+                return (Circulation.NO_COPIES if exists else Circulation.NOT_FOUND), None, None
+
+            self._db.execute("INSERT INTO transactions (user_id, book_id, borrow_date, due_date) VALUES (?, ?, ?, ?)", (member_id, book_id, str(borrow_date), str(due_date)))
+            book_info = self._db.execute("SELECT * FROM books WHERE id = ?", (book_id,)).fetchone()
+
+        return Circulation.BORROWED, book_info, due_date
+
+    def return_book(self, book_id, member_id, today):
+        with self._write_transaction():
+            transaction_info = self._db.execute("SELECT id, borrow_date, due_date FROM transactions WHERE book_id = ? AND user_id = ? AND due_date is not NULL", (book_id, member_id)).fetchone()
+            if transaction_info is None:
+                return Circulation.NOT_BORROWED, None
+
+            transaction_id, borrow_date, due_date = transaction_info
+            if today > datetime.datetime.strptime(due_date, '%Y-%m-%d').date():
+                return Circulation.LATE, borrow_date
+
+            self._db.execute("UPDATE transactions SET due_date = NULL, return_date = ? WHERE id = ?", (str(today), transaction_id))
+            self._db.execute("UPDATE books SET no_of_copies = no_of_copies + 1 WHERE id = ?", (book_id,))
+
+        return Circulation.RETURNED, borrow_date
+
+
+@instrument_methods(exclude=('build_query',))
+class BookSearch(object):
+
+    # title matches rank above author matches, which rank above genre matches.
+    # ranking and paging happen on the FTS index alone, so only the requested
+    # page is joined to books; scoring still visits every match
+    search_sql = ("SELECT books.id, books.title, books.author, books.genre, books.ISBN, books.no_of_copies "
+                  "FROM (SELECT rowid, bm25(books_fts, 10.0, 5.0, 1.0) AS score FROM books_fts "
+                  "WHERE books_fts MATCH ? ORDER BY score LIMIT ? OFFSET ?) AS matches "
+                  "INNER JOIN books ON books.id = matches.rowid "
+                  "ORDER BY matches.score")
+
+    def __init__(self, connection=None):
+        self._db = connection if connection is not None else storage.connection()
+
+    @staticmethod
+    def build_query(text):
+        terms = re.findall(r"\w+", text)
+        return " ".join(f'"{term}"*' for term in terms)
+
+    def search(self, text, page=1, page_size=20):
+        query = self.build_query(text)
+        if not query:
+            return []
+
+        page = max(int(page), 1)
+        cursor = self._db.execute(self.search_sql, (query, page_size, (page - 1) * page_size))
+        return cursor.fetchall()
+
+    def rebuild(self):
+        with self._db:
+            self._db.execute("INSERT INTO books_fts(books_fts) VALUES ('rebuild')")
+
+
+@instrument_methods(exclude=('addBook_to_BookList', 'deleteBook_from_BookList', 'find_by_id', 'find_by_isbn',
+                             'find_by_title', 'find_by_genre', 'get_bookList', 'clear'))
+class Library(object):
+
+    def __init__(self, connection=None):
+        self._db = connection if connection is not None else storage.connection()
+        self._books_by_id = {}
+        self._books_by_isbn = {}
+        self._books_by_title = {}
+        self._books_by_genre = {}
+
+    def __len__(self):
+        return len(self._books_by_id)
+
+    def load_books_from_db(self):
+        try:
+            self.clear()
+            for book_data in iter_books(self._db, batch_size=10000):
+                id, title, author, genre, Isbn, no_of_copies = book_data
+                book = Book(title, author, genre, Isbn, no_of_copies, id)
+                self.addBook_to_BookList(book)
+            print(f"Loaded {len(self)} books from the database.")
+        except sqlite3.IntegrityError as e:
+            print(f"Error loading books from the database!: {e}")
+        except Exception as e:
+            print(f"Error: {e}")
+
+    def sync_new_books(self, last_id):
+        for book_data in self._db.execute("SELECT * FROM books WHERE id > ?", (last_id,)):
+            id, title, author, genre, Isbn, no_of_copies = book_data
+            self.addBook_to_BookList(Book(title, author, genre, Isbn, no_of_copies, id))
+
+    def clear(self):
+        self._books_by_id.clear()
+        self._books_by_isbn.clear()
+        self._books_by_title.clear()
+        self._books_by_genre.clear()
+
+    def addBook_to_BookList(self, book):
+        old_book = self._books_by_id.get(book.id)
+        if old_book is not None:
+            self.deleteBook_from_BookList(old_book)
+
+        self._books_by_id[book.id] = book
+        self._books_by_isbn[book._Isbn] = book
+        # titles are nearly unique, so the title index holds the Book itself and
+        # only becomes a list for the rare titles shared by several books
+        same_title = self._books_by_title.get(book._title)
+        if same_title is None:
+            self._books_by_title[book._title] = book
+        elif isinstance(same_title, list):
+            same_title.append(book)
+        else:
+            self._books_by_title[book._title] = [same_title, book]
+        self._books_by_genre.setdefault(book._genre, {})[book.id] = book
+
+    def deleteBook_from_BookList(self, book):
+        book = self._books_by_id.pop(book.id, None)
+        if book is None:
+            return
+        self._books_by_isbn.pop(book._Isbn, None)
+        self._remove_from_title_index(book)
+        self._remove_from_index(self._books_by_genre, book._genre, book.id)
+
+    def update_book(self, book, title, author, genre, no_of_copies):
+        self.deleteBook_from_BookList(book)
+        book._title = title
+        book._author = author
+        book._genre = genre
+        book.no_of_copies = no_of_copies
+        self.addBook_to_BookList(book)
+
+    def _remove_from_title_index(self, book):
+        same_title = self._books_by_title.get(book._title)
+        if same_title is book:
+            del self._books_by_title[book._title]
+        elif isinstance(same_title, list):
+            same_title.remove(book)
+            if len(same_title) == 1:
+                self._books_by_title[book._title] = same_title[0]
+
+    @staticmethod
+    def _remove_from_index(index, key, book_id):
+        books = index.get(key)
+        if books is not None:
+            books.pop(book_id, None)
+            if not books:
+                del index[key]
+
+    def find_by_id(self, book_id):
+        return self._books_by_id.get(book_id)
+
+    def find_by_isbn(self, Isbn):
+        return self._books_by_isbn.get(Isbn)
+
+    def find_by_title(self, title):
+        books = self._books_by_title.get(title)
+        if books is None:
+            return []
+        return list(books) if isinstance(books, list) else [books]
+
+    def find_by_genre(self, genre):
+        return list(self._books_by_genre.get(genre, {}).values())
+
+    def get_bookList(self):
+        return list(self._books_by_id.values())
+    
+
+class Book(object):
+
+    __slots__ = ('id', '_title', '_author', '_genre', '_Isbn', 'no_of_copies')
+
+    def __init__(self, title, author, genre, Isbn, no_of_copies, id=None):
+        self.id = id
+        self._title = title
+        self._author = author
+        self._genre = genre
+        self._Isbn = Isbn
+        self.no_of_copies = no_of_copies
+     
+    
+choice = None
+if __name__ == '__main__':
+
+    db = storage.connection()
+    library = Library(db)
+    library.load_books_from_db()
+
+    option1 = {'1': 'Registration', '2': 'Login', '0': 'Exit'}
+    option2 = {'1': "Add Member", '2': "Delete Member", '3': "Update member info", '4': "Show all members", '5': 'Add Book', '6': "Delete Book", '7': "Update Book", '8': "Show all books",'9': "Populate books from csv", '10': "Reports", '11': "Export data", '0': 'Exit'}
+    option3 = {'1': "Search Books",'2': "Show all books", '3': "Borrow book", '4': "Return book",'5': "Show Borrow List", '6': "Borrow history", '0': "Exit"}
+    admin = None
+    
+    while True:
+        print("----Welcome to the Libarary Mangement System----")
+        for x, y in option1.items():
+            print(f"{x}.  {y}")
+
+        choice = input("Choose an option: ")
+        if choice == '1':
+            username = input("Please enter your username: ")
+            password = input("Enter your password: ")
+
+            admin = Admin(username, password, db)
+            admin.insert_into_db()
+        
+        elif choice == '2':
+            username = input("Enter your username: ")
+            password = input("Enter your password: ")
+
+            cursor = db.execute("SELECT * FROM members WHERE username = ?", (username,))
+            user_info = cursor.fetchone()
+
+            if user_info is None:
+                print(f"User {username} not found!")
+            else:
+                user_id, uname, hash_passw, role = user_info
+                
+                if role == 'Admin':
+                    user = Admin(uname, hash_passw, db)
+                else:
+                    user = Member(uname, hash_passw, connection=db)
+
+                hashed_password = user.hash_password(password)
+                if user.check_password(hashed_password):
+                    if user.get_role() == 'Admin':
+
+                        print(f"Login successful! Welcome, {uname}")
+                        while True:
+                            print("-------------------------------")
+                            print("----------ADMIN PANEL----------")
+                            print("-------------------------------")
+                            for x, y in option2.items(): 
+                                print(f"{x}.  {y}")
+
+                            choice2 = input("Choose an option: ") 
+                            if choice2 == '1':
+                                member_name = input("Enter member name: ")
+                                member_pass = input("Enter password: ")
+                                user.add_member(member_name, member_pass)
+
+                            elif choice2 == '2':
+                                member_to_remove = input("Enter member name to remove: ")
+                                user.delete_member(member_to_remove)
+
+                            elif choice2 == '3':
+                                user_name_toUpdate = input("Enter member name to update: ")
+
+                                try:
+                                    cursor = db.execute("SELECT * FROM members WHERE username = ?", (user_name_toUpdate,))
+                                    user_info = cursor.fetchone()
+
+                                    if user_info is None:
+                                        print("User not found!")
+                                    else:
+                                        user_id, uname, hash_passw, role = user_info
+
+                                        if user_name_toUpdate == uname:
+                                            old_password = input("Enter existing password: ")
+                                            hashed_old_password = user.hash_password(old_password)
+
+                                            if hashed_old_password == hash_passw:
+                                                new_username = input("Enter member's new name: ")
+                                                new_password = input("Enter new password: ")
+                                                re_new_password = input("Re-enter new password: ")
+
+                                                if new_password == re_new_password:
+                                                    hashed_new_password = user.hash_password(new_password)
+                                                    user.update_member(new_username, hashed_new_password, user_name_toUpdate)
+                                                else:
+                                                    print("Password should match!")
+                                            else:
+                                                print("password incorrect!")
+                                        else:
+                                            print(f"{user_name_toUpdate} didn't match!")
+                                except sqlite3.IntegrityError as e:
+                                    print(f"Error: {e}")
+                                except Exception as e:
+                                    print(f"Error: {e}")
+
+                            elif choice2 == '4':
+                                user.show_all_members()
+        
+                            elif choice2 == '5':
+
+                                title = str(input("Please enter the title of the book: "))
+                                author = str(input("Enter the author name: "))
+                                genre = str(input("Enter genre type: "))
+                                Isbn = int(input("Enter ISBN number: "))
+                                no_of_copies = int(input("Enter no. of copies: "))
+
+                                book = Book(title, author, genre, Isbn, no_of_copies)
+                                user.add_book_from_library(library, book)
+                                
+                            elif choice2 == '6':
+                              
+                                book_to_remove = str(input("Enter book name to remove: "))
+                                user.delete_book(library, book_to_remove)
+                                
+                            elif choice2 == '7':
+
+                                book_to_update = input("Enter book name to update: ")
+                                user.update_book_info(library, book_to_update)
+
+                            elif choice2 == '8':
+                                next_after = user.show_all_books()
+                                while next_after is not None and input("Show next page? (y/n): ").strip().lower() == 'y':
+                                    next_after = user.show_all_books(next_after)
+
+                            elif choice2 == '9':
+                                csv_path = input("Enter the path to your CSV file: ").strip()
+                                upsert = input("Update no. of copies for books that already exist? (y/n): ").strip().lower() == 'y'
+                                user.populate_books_from_csv(csv_path, upsert=upsert, library=library)
+
+                            elif choice2 == '10':
+                                user.show_reports(Member._current_date())
+
+                            elif choice2 == '11':
+                                kind = input("Export books, members or transactions?: ").strip().lower()
+                                fmt = input("Format (csv/jsonl): ").strip().lower() or 'csv'
+                                path = input("Enter the path of the export file: ").strip()
+                                since = input("Only changes since cursor (leave empty for a full export): ").strip()
+                                user.export_data(kind, path, fmt, int(since) if since else None)
+
+                            elif choice2 == '0':
+                                break
+                            else:
+                                print(f"Invalid option: {choice2}")
+                    
+                        
+                    elif user.get_role() == 'Member':
+                        
+                        print("Login successful.")
+                        print(f"Welcome, {uname}")
+
+                        while True:
+                            print(f"{uname}'s Panel---------")
+
+                            for key, value in option3.items():
+                                print(f"{key}.   {value}")
+
+                            choice3 = input("Choose an option: ")
+                            if choice3 == '1':
+
+                                book_choice = input("Enter title, author or genre to search (prefixes work too): ")
+                                search_page = 1
+                                while len(user.search_books(book_choice, search_page)) == 20:
+                                    if input("Show next page? (y/n): ").strip().lower() != 'y':
+                                        break
+                                    search_page += 1
+            
+                            elif choice3 == '2':
+                                next_after = user.show_all_books()
+                                while next_after is not None and input("Show next page? (y/n): ").strip().lower() == 'y':
+                                    next_after = user.show_all_books(next_after)
+
+                            elif choice3 == '3':
+                                book_to_borrow = int(input("Enter book ID to borrow: "))
+                                user.borrow_books(book_to_borrow, user_id)
+
+                            elif choice3 == '4':
+                                book_to_return = int(input("Enter book ID to return: "))
+                                user.return_books(book_to_return, user_id)
+
+                            elif choice3 == '5':
+                                user.show_borrowList(user_id, uname)
+
+                            elif choice3 == '6':
+                                user.show_history(user_id)
+
+                            elif choice3 == '0':
+                                break
+
+                            else:
+                                print(f"Invalid option...{choice3}")
+                else:
+                    print("Incorrect Password.")
+        elif choice == '0':
+            break
+        else:
+            print(f"Invalid choice!{choice}")
+    
+    storage.close_all()
+
+    metrics_file = os.environ.get("LIBRARY_METRICS_FILE")
+    if metrics_file:
+        metrics.dump(metrics_file)
\ No newline at end of file
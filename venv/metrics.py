@@ -0,0 +1,326 @@
+import bisect
+import collections
+import functools
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+slow_query_log = logging.getLogger("library.slow_queries")
+statement_log = logging.getLogger("library.sql")
+
+# latency bucket upper bounds, in seconds
+buckets = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Histogram(object):
+
+    __slots__ = ('counts', 'count', 'total', 'errors', 'rows')
+
+    def __init__(self):
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.errors = 0
+        self.rows = 0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(buckets, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(buckets + (float('inf'),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound if bound != float('inf') else buckets[-1]
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'rows': self.rows,
+            'total_ms': round(self.total * 1000, 3),
+            'mean_ms': round(self.total / self.count * 1000, 3) if self.count else None,
+            'p50_ms_le': None if not self.count else self.quantile(0.5) * 1000,
+            'p99_ms_le': None if not self.count else self.quantile(0.99) * 1000,
+            'buckets': {str(bound * 1000): count for bound, count in zip(buckets + (float('inf'),), self.counts)},
+        }
+
+
+class Metrics(object):
+
+    max_statements = 1000
+
+    def __init__(self, enabled=True, slow_query_ms=100.0, slow_query_history=100):
+        self.enabled = enabled
+        self.slow_query_seconds = slow_query_ms / 1000
+        self._lock = threading.Lock()
+        self._operations = collections.defaultdict(Histogram)
+        self._statements = collections.defaultdict(Histogram)
+        self._slow_queries = collections.deque(maxlen=slow_query_history)
+        self.commits = 0
+        self.started = time.time()
+
+    def reset(self):
+        with self._lock:
+            self._operations.clear()
+            self._statements.clear()
+            self._slow_queries.clear()
+            self.commits = 0
+            self.started = time.time()
+
+    def record_operation(self, name, seconds, failed=False):
+        with self._lock:
+            histogram = self._operations[name]
+            histogram.observe(seconds)
+            if failed:
+                histogram.errors += 1
+
+    def record_statement(self, sql, seconds, failed=False):
+        with self._lock:
+            if sql not in self._statements and len(self._statements) >= self.max_statements:
+                sql = '<other>'
+            histogram = self._statements[sql]
+            histogram.observe(seconds)
+            if failed:
+                histogram.errors += 1
+        if seconds >= self.slow_query_seconds:
+            self._slow_queries.append({'time': time.time(), 'ms': round(seconds * 1000, 3), 'sql': sql})
+            slow_query_log.warning("slow query (%.1f ms): %s", seconds * 1000, sql)
+
+    def record_rows(self, sql, rows):
+        with self._lock:
+            histogram = self._statements.get(sql)
+            if histogram is None:
+                histogram = self._statements.get('<other>')
+            if histogram is not None:
+                histogram.rows += rows
+
+    def record_commit(self):
+        with self._lock:
+            self.commits += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'started': self.started,
+                'uptime_seconds': round(time.time() - self.started, 3),
+                'commits': self.commits,
+                'operations': {name: histogram.snapshot() for name, histogram in self._operations.items()},
+                'statements': {sql: histogram.snapshot() for sql, histogram in self._statements.items()},
+                'slow_queries': list(self._slow_queries),
+            }
+
+    def to_json(self, indent=2):
+        return json.dumps(self.snapshot(), indent=indent)
+
+    def dump(self, path):
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(self.to_json())
+
+    def to_prometheus(self):
+        with self._lock:
+            lines = [
+                "# TYPE library_commits_total counter",
+                f"library_commits_total {self.commits}",
+            ]
+            for metric, label, histograms in (('library_operation', 'operation', self._operations),
+                                              ('library_statement', 'sql', self._statements)):
+                lines.append(f"# TYPE {metric}_seconds histogram")
+                for name, histogram in histograms.items():
+                    label_value = _escape_label(name)
+                    cumulative = 0
+                    for bound, count in zip(buckets + (float('inf'),), histogram.counts):
+                        cumulative += count
+                        le = '+Inf' if bound == float('inf') else repr(bound)
+                        lines.append(f'{metric}_seconds_bucket{{{label}="{label_value}",le="{le}"}} {cumulative}')
+                    lines.append(f'{metric}_seconds_sum{{{label}="{label_value}"}} {histogram.total}')
+                    lines.append(f'{metric}_seconds_count{{{label}="{label_value}"}} {histogram.count}')
+                lines.append(f"# TYPE {metric}_errors_total counter")
+                for name, histogram in histograms.items():
+                    lines.append(f'{metric}_errors_total{{{label}="{_escape_label(name)}"}} {histogram.errors}')
+
+            lines.append("# TYPE library_statement_rows_total counter")
+            for sql, histogram in self._statements.items():
+                lines.append(f'library_statement_rows_total{{sql="{_escape_label(sql)}"}} {histogram.rows}')
+        return "\n".join(lines) + "\n"
+
+
+def _escape_label(value):
+    return re.sub(r'\s+', ' ', value).replace('\\', '\\\\').replace('"', '\\"')
+
+
+metrics = Metrics(enabled=os.environ.get("LIBRARY_METRICS", "1") != "0",
+                  slow_query_ms=float(os.environ.get("LIBRARY_SLOW_QUERY_MS", 100)))
+
+
+class TracedCursor(sqlite3.Cursor):
+
+    _sql = None
+    _rows = 0
+
+    def _flush_rows(self):
+        # rows read by iteration are counted locally and reported once
+        if self._rows:
+            if self._sql is not None:
+                metrics.record_rows(self._sql, self._rows)
+            self._rows = 0
+
+    def execute(self, sql, parameters=()):
+        self._flush_rows()
+        if not metrics.enabled:
+            self._sql = None
+            return super().execute(sql, parameters)
+        self._sql = sql
+        start = time.perf_counter()
+        try:
+            result = super().execute(sql, parameters)
+        except BaseException:
+            metrics.record_statement(sql, time.perf_counter() - start, failed=True)
+            raise
+        metrics.record_statement(sql, time.perf_counter() - start)
+        return result
+
+    def executemany(self, sql, seq_of_parameters):
+        self._flush_rows()
+        self._sql = None
+        if not metrics.enabled:
+            return super().executemany(sql, seq_of_parameters)
+        start = time.perf_counter()
+        try:
+            result = super().executemany(sql, seq_of_parameters)
+        except BaseException:
+            metrics.record_statement(sql, time.perf_counter() - start, failed=True)
+            raise
+        metrics.record_statement(sql, time.perf_counter() - start)
+        return result
+
+    def fetchone(self):
+        row = super().fetchone()
+        if row is not None and self._sql is not None:
+            metrics.record_rows(self._sql, 1)
+        return row
+
+    def fetchmany(self, size=None):
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        if rows and self._sql is not None:
+            metrics.record_rows(self._sql, len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        if rows and self._sql is not None:
+            metrics.record_rows(self._sql, len(rows))
+        return rows
+
+    def __next__(self, _next=sqlite3.Cursor.__next__):
+        try:
+            row = _next(self)
+        except StopIteration:
+            self._flush_rows()
+            raise
+        self._rows += 1
+        return row
+
+    def close(self):
+        self._flush_rows()
+        super().close()
+
+
+class TracedConnection(sqlite3.Connection):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # every statement SQLite runs, trigger bodies included, at DEBUG level
+        if statement_log.isEnabledFor(logging.DEBUG):
+            self.set_trace_callback(statement_log.debug)
+
+    # with metrics disabled, statements go through plain sqlite3 cursors so
+    # fetching and iterating rows costs nothing extra
+    def cursor(self, factory=None):
+        if factory is None:
+            factory = TracedCursor if metrics.enabled else sqlite3.Cursor
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        if not metrics.enabled:
+            return super().execute(sql, parameters)
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        if not metrics.enabled:
+            return super().executemany(sql, seq_of_parameters)
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        if not metrics.enabled or not self.in_transaction:
+            return super().commit()
+        start = time.perf_counter()
+        super().commit()
+        metrics.record_statement("COMMIT", time.perf_counter() - start)
+        metrics.record_commit()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None or not metrics.enabled or not self.in_transaction:
+            return super().__exit__(exc_type, exc_value, traceback)
+        start = time.perf_counter()
+        result = super().__exit__(exc_type, exc_value, traceback)
+        metrics.record_statement("COMMIT", time.perf_counter() - start)
+        metrics.record_commit()
+        return result
+
+
+def connection_factory():
+    # statement tracing is only wired in when metrics are on; otherwise the
+    # pool hands out plain sqlite3 connections
+    return TracedConnection if metrics.enabled else sqlite3.Connection
+
+
+def instrument(name):
+
+    def decorator(function):
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not metrics.enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                result = function(*args, **kwargs)
+            except BaseException:
+                metrics.record_operation(name, time.perf_counter() - start, failed=True)
+                raise
+            metrics.record_operation(name, time.perf_counter() - start)
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def instrument_methods(exclude=()):
+    # times every public method defined on the class itself, except the
+    # per-book helpers in `exclude` that sit on hot loops
+
+    def decorator(cls):
+        for attribute, value in list(vars(cls).items()):
+            if attribute.startswith('_') or attribute in exclude:
+                continue
+            name = f"{cls.__name__}.{attribute}"
+            if isinstance(value, staticmethod):
+                setattr(cls, attribute, staticmethod(instrument(name)(value.__func__)))
+            elif isinstance(value, classmethod):
+                setattr(cls, attribute, classmethod(instrument(name)(value.__func__)))
+            elif callable(value):
+                setattr(cls, attribute, instrument(name)(value))
+        return cls
+
+    return decorator
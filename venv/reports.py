@@ -0,0 +1,41 @@
+class Reports(object):
+
+    def __init__(self, connection):
+        self._db = connection
+
+    def overdue_loans(self, as_of, limit=100):
+        cursor = self._db.execute("SELECT transactions.id, transactions.user_id, members.username, transactions.book_id, books.title, "
+                                  "transactions.borrow_date, transactions.due_date FROM transactions "
+                                  " INNER JOIN members ON members.id = transactions.user_id "
+                                  " INNER JOIN books ON books.id = transactions.book_id "
+                                  " WHERE transactions.due_date is not NULL AND transactions.due_date < ? "
+                                  " ORDER BY transactions.due_date LIMIT ?", (str(as_of), limit))
+        return cursor.fetchall()
+
+    def most_borrowed_books(self, limit=10):
+        # book_borrow_counts is kept up to date by a trigger on transactions
+        cursor = self._db.execute("SELECT books.id, books.title, books.author, books.genre, book_borrow_counts.borrow_count "
+                                  "FROM book_borrow_counts INNER JOIN books ON books.id = book_borrow_counts.book_id "
+                                  "ORDER BY book_borrow_counts.borrow_count DESC LIMIT ?", (limit,))
+        return cursor.fetchall()
+
+    def most_borrowed_genres(self, limit=10):
+        # genre_borrow_counts is kept up to date by triggers on transactions and books
+        cursor = self._db.execute("SELECT NULLIF(genre, ''), borrow_count FROM genre_borrow_counts "
+                                  "WHERE borrow_count > 0 ORDER BY borrow_count DESC LIMIT ?", (limit,))
+        return cursor.fetchall()
+
+    def member_history(self, member_id, limit=50, before=None):
+        # newest first; pass the last row's (borrow_date, id) back as `before` for the next page
+        query = ("SELECT transactions.id, transactions.book_id, books.title, transactions.borrow_date, "
+                 "transactions.due_date, transactions.return_date FROM transactions "
+                 " LEFT JOIN books ON books.id = transactions.book_id "
+                 " WHERE transactions.user_id = ?")
+        params = [member_id]
+        if before is not None:
+            borrow_date, transaction_id = before
+            query += " AND (transactions.borrow_date, transactions.id) < (?, ?)"
+            params += [str(borrow_date), transaction_id]
+        query += " ORDER BY transactions.borrow_date DESC, transactions.id DESC LIMIT ?"
+        params.append(limit)
+        return self._db.execute(query, params).fetchall()
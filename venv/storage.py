@@ -0,0 +1,290 @@
+import contextlib
+import sqlite3
+import threading
+
+
+def create_schema(connection):
+    # several processes can open a fresh or older database at the same time;
+    # holding the write lock makes the existence checks and backfills below
+    # run exactly once
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        _create_tables(connection)
+    except BaseException:
+        connection.rollback()
+        raise
+    connection.commit()
+
+
+def _create_tables(connection):
+
+    connection.execute("CREATE TABLE IF NOT EXISTS members"
+                       "(id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                       "username TEXT UNIQUE NOT NULL,"
+                       "password TEXT NOT NULL,"
+                       "role TEXT NOT NULL)")
+
+    connection.execute("CREATE TABLE IF NOT EXISTS books"
+                       "(id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                       "title TEXT NOT NULL,"
+                       "author TEXT NOT NULL,"
+                       "genre TEXT,"
+                       "ISBN INTEGER UNIQUE NOT NULL,"
+                       "no_of_copies INTEGER NOT NULL)")
+
+    connection.execute("CREATE TABLE IF NOT EXISTS transactions"
+                       "(id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                       "user_id INTEGER,"
+                       "book_id INTEGER,"
+                       "borrow_date TEXT,"
+                       "due_date TEXT,"
+                       "return_date TEXT,"
+                       "FOREIGN KEY(user_id) REFERENCES members(id),"
+                       "FOREIGN KEY(book_id) REFERENCES books(id))")
+
+    transaction_columns = [column[1] for column in connection.execute("PRAGMA table_info(transactions)")]
+    if 'return_date' not in transaction_columns:
+        connection.execute("ALTER TABLE transactions ADD COLUMN return_date TEXT")
+
+    # open loans are looked up by member and by (member, book) on every
+    # borrow/return; the partial indexes only hold the open rows
+    connection.execute("CREATE INDEX IF NOT EXISTS transactions_open_loans "
+                       "ON transactions(user_id, book_id) WHERE due_date IS NOT NULL")
+    connection.execute("CREATE INDEX IF NOT EXISTS transactions_open_due "
+                       "ON transactions(due_date) WHERE due_date IS NOT NULL")
+    connection.execute("CREATE INDEX IF NOT EXISTS transactions_member_history "
+                       "ON transactions(user_id, borrow_date)")
+    connection.execute("CREATE INDEX IF NOT EXISTS transactions_book_history "
+                       "ON transactions(book_id, borrow_date)")
+    connection.execute("CREATE INDEX IF NOT EXISTS books_genre ON books(genre)")
+
+    counts_exist = connection.execute("SELECT 1 FROM sqlite_master WHERE name = 'book_borrow_counts'").fetchone()
+
+    connection.execute("CREATE TABLE IF NOT EXISTS book_borrow_counts"
+                       "(book_id INTEGER PRIMARY KEY,"
+                       "borrow_count INTEGER NOT NULL)")
+    connection.execute("CREATE INDEX IF NOT EXISTS book_borrow_counts_rank ON book_borrow_counts(borrow_count)")
+
+    connection.execute("CREATE TRIGGER IF NOT EXISTS book_borrow_counts_insert AFTER INSERT ON transactions BEGIN "
+                       "INSERT INTO book_borrow_counts(book_id, borrow_count) VALUES (new.book_id, 1) "
+                       "ON CONFLICT(book_id) DO UPDATE SET borrow_count = borrow_count + 1; "
+                       "END")
+
+    connection.execute("CREATE TRIGGER IF NOT EXISTS book_borrow_counts_delete AFTER DELETE ON transactions BEGIN "
+                       "UPDATE book_borrow_counts SET borrow_count = borrow_count - 1 WHERE book_id = old.book_id; "
+                       "END")
+
+    if counts_exist is None:
+        connection.execute("INSERT INTO book_borrow_counts(book_id, borrow_count) "
+                           "SELECT book_id, COUNT(*) FROM transactions WHERE book_id IS NOT NULL GROUP BY book_id")
+
+    # the same per genre, with books without a genre under ''; a book's
+    # count moves with it when its genre changes and leaves when it's deleted
+    genre_counts_exist = connection.execute("SELECT 1 FROM sqlite_master WHERE name = 'genre_borrow_counts'").fetchone()
+
+    connection.execute("CREATE TABLE IF NOT EXISTS genre_borrow_counts"
+                       "(genre TEXT PRIMARY KEY NOT NULL,"
+                       "borrow_count INTEGER NOT NULL)")
+    connection.execute("CREATE INDEX IF NOT EXISTS genre_borrow_counts_rank ON genre_borrow_counts(borrow_count)")
+
+    connection.execute("CREATE TRIGGER IF NOT EXISTS genre_borrow_counts_insert AFTER INSERT ON transactions BEGIN "
+                       "INSERT INTO genre_borrow_counts(genre, borrow_count) "
+                       "SELECT COALESCE(genre, ''), 1 FROM books WHERE id = new.book_id "
+                       "ON CONFLICT(genre) DO UPDATE SET borrow_count = borrow_count + 1; "
+                       "END")
+
+    connection.execute("CREATE TRIGGER IF NOT EXISTS genre_borrow_counts_delete AFTER DELETE ON transactions BEGIN "
+                       "UPDATE genre_borrow_counts SET borrow_count = borrow_count - 1 "
+                       "WHERE genre = (SELECT COALESCE(genre, '') FROM books WHERE id = old.book_id); "
+                       "END")
+
+    connection.execute("CREATE TRIGGER IF NOT EXISTS genre_borrow_counts_book_genre "
+                       "AFTER UPDATE OF genre ON books WHEN COALESCE(old.genre, '') != COALESCE(new.genre, '') BEGIN "
+                       "UPDATE genre_borrow_counts SET borrow_count = borrow_count - "
+                       "(SELECT borrow_count FROM book_borrow_counts WHERE book_id = old.id) "
+                       "WHERE genre = COALESCE(old.genre, '') AND EXISTS (SELECT 1 FROM book_borrow_counts WHERE book_id = old.id); "
+                       "INSERT INTO genre_borrow_counts(genre, borrow_count) "
+                       "SELECT COALESCE(new.genre, ''), borrow_count FROM book_borrow_counts WHERE book_id = new.id "
+                       "ON CONFLICT(genre) DO UPDATE SET borrow_count = borrow_count + excluded.borrow_count; "
+                       "END")
+
+    connection.execute("CREATE TRIGGER IF NOT EXISTS genre_borrow_counts_book_delete AFTER DELETE ON books BEGIN "
+                       "UPDATE genre_borrow_counts SET borrow_count = borrow_count - "
+                       "(SELECT borrow_count FROM book_borrow_counts WHERE book_id = old.id) "
+                       "WHERE genre = COALESCE(old.genre, '') AND EXISTS (SELECT 1 FROM book_borrow_counts WHERE book_id = old.id); "
+                       "END")
+
+    if genre_counts_exist is None:
+        connection.execute("INSERT INTO genre_borrow_counts(genre, borrow_count) "
+                           "SELECT COALESCE(books.genre, ''), SUM(book_borrow_counts.borrow_count) "
+                           "FROM book_borrow_counts INNER JOIN books ON books.id = book_borrow_counts.book_id "
+                           "GROUP BY COALESCE(books.genre, '')")
+
+    fts_exists = connection.execute("SELECT 1 FROM sqlite_master WHERE name = 'books_fts'").fetchone()
+
+    connection.execute("CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5"
+                       "(title, author, genre,"
+                       "content='books', content_rowid='id',"
+                       "tokenize='unicode61 remove_diacritics 2', prefix='2 3')")
+
+    connection.execute("CREATE TRIGGER IF NOT EXISTS books_fts_insert AFTER INSERT ON books BEGIN "
+                       "INSERT INTO books_fts(rowid, title, author, genre) VALUES (new.id, new.title, new.author, new.genre); "
+                       "END")
+
+    connection.execute("CREATE TRIGGER IF NOT EXISTS books_fts_delete AFTER DELETE ON books BEGIN "
+                       "INSERT INTO books_fts(books_fts, rowid, title, author, genre) VALUES ('delete', old.id, old.title, old.author, old.genre); "
+                       "END")
+
+    connection.execute("CREATE TRIGGER IF NOT EXISTS books_fts_update AFTER UPDATE OF title, author, genre ON books BEGIN "
+                       "INSERT INTO books_fts(books_fts, rowid, title, author, genre) VALUES ('delete', old.id, old.title, old.author, old.genre); "
+                       "INSERT INTO books_fts(rowid, title, author, genre) VALUES (new.id, new.title, new.author, new.genre); "
+                       "END")
+
+    connection.execute("CREATE TABLE IF NOT EXISTS catalog_state"
+                       "(id INTEGER PRIMARY KEY CHECK (id = 1),"
+                       "version INTEGER NOT NULL,"
+                       "modified TEXT NOT NULL)")
+    connection.execute("INSERT OR IGNORE INTO catalog_state (id, version, modified) "
+                       "VALUES (1, 0, strftime('%Y-%m-%d %H:%M:%f', 'now'))")
+
+    # modified keeps milliseconds so the API can tell two writes in the same
+    # second apart; the catalog_state_* triggers stored whole seconds
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        connection.execute(f"DROP TRIGGER IF EXISTS catalog_state_{event.lower()}")
+        connection.execute(f"CREATE TRIGGER IF NOT EXISTS catalog_modified_{event.lower()} AFTER {event} ON books BEGIN "
+                           "UPDATE catalog_state SET version = version + 1, "
+                           "modified = strftime('%Y-%m-%d %H:%M:%f', 'now') WHERE id = 1; "
+                           "END")
+
+    changes_exist = connection.execute("SELECT 1 FROM sqlite_master WHERE name = 'book_changes'").fetchone()
+
+    connection.execute("CREATE TABLE IF NOT EXISTS book_changes"
+                       "(seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+                       "book_id INTEGER UNIQUE NOT NULL,"
+                       "changed_at TEXT NOT NULL,"
+                       "deleted INTEGER NOT NULL DEFAULT 0)")
+
+    for event, row in (('INSERT', 'new'), ('UPDATE', 'new'), ('DELETE', 'old')):
+        connection.execute(f"CREATE TRIGGER IF NOT EXISTS book_changes_{event.lower()} AFTER {event} ON books BEGIN "
+                           "INSERT OR REPLACE INTO book_changes(book_id, changed_at, deleted) "
+                           f"VALUES ({row}.id, CURRENT_TIMESTAMP, {int(event == 'DELETE')}); "
+                           "END")
+
+    if changes_exist is None:
+        connection.execute("INSERT INTO book_changes(book_id, changed_at) SELECT id, CURRENT_TIMESTAMP FROM books ORDER BY id")
+
+    # loans are only ever appended, except that a return updates the borrow's
+    # row; new loans are found by id, and only returns are logged. A return
+    # takes its seq from the transactions id sequence, so one cursor orders
+    # both and ids simply skip the values used by returns
+    for event in ('insert', 'update', 'delete'):
+        connection.execute(f"DROP TRIGGER IF EXISTS transaction_changes_{event}")
+    connection.execute("DROP TABLE IF EXISTS transaction_changes")
+
+    connection.execute("CREATE TABLE IF NOT EXISTS transaction_returns"
+                       "(seq INTEGER PRIMARY KEY,"
+                       "transaction_id INTEGER NOT NULL)")
+
+    connection.execute("CREATE TRIGGER IF NOT EXISTS transaction_returns_log AFTER UPDATE OF return_date ON transactions "
+                       "WHEN old.return_date IS NULL AND new.return_date IS NOT NULL BEGIN "
+                       "UPDATE sqlite_sequence SET seq = seq + 1 WHERE name = 'transactions'; "
+                       "INSERT INTO transaction_returns(seq, transaction_id) "
+                       "SELECT seq, new.id FROM sqlite_sequence WHERE name = 'transactions'; "
+                       "END")
+
+    if fts_exists is None:
+        connection.execute("INSERT INTO books_fts(books_fts) VALUES ('rebuild')")
+
+
+class Storage(object):
+
+    default_pragmas = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -65536,
+        'mmap_size': 268435456,
+        'temp_store': 'MEMORY',
+    }
+
+    def __init__(self, path="library.sqlite", pool_size=8, cached_statements=256, timeout=30.0, pragmas=None,
+                 factory=sqlite3.Connection):
+        self._path = path
+        self._factory = factory
+        self._pool_size = pool_size
+        self._cached_statements = cached_statements
+        self._timeout = timeout
+        self._pragmas = dict(self.default_pragmas)
+        if pragmas:
+            self._pragmas.update(pragmas)
+
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._idle = []
+        self._connections = []
+        self._schema_ready = False
+
+    def _connect(self):
+        # connections move between threads through the pool, but only one
+        # thread holds a given connection at a time
+        connection = sqlite3.connect(self._path, timeout=self._timeout,
+                                     cached_statements=self._cached_statements, check_same_thread=False,
+                                     factory=self._factory)
+        for name, value in self._pragmas.items():
+            connection.execute(f"PRAGMA {name} = {value}")
+        return connection
+
+    def connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            return connection
+
+        with self._lock:
+            if self._idle:
+                connection = self._idle.pop()
+            else:
+                connection = self._connect()
+                self._connections.append(connection)
+
+            if not self._schema_ready:
+                create_schema(connection)
+                self._schema_ready = True
+
+        self._local.connection = connection
+        return connection
+
+    def release(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            return
+        self._local.connection = None
+
+        if connection.in_transaction:
+            connection.rollback()
+        with self._lock:
+            if len(self._idle) < self._pool_size:
+                self._idle.append(connection)
+                return
+            self._connections.remove(connection)
+        connection.close()
+
+    @contextlib.contextmanager
+    def session(self):
+        try:
+            yield self.connection()
+        finally:
+            self.release()
+
+    def close_all(self):
+        with self._lock:
+            for connection in self._connections:
+                try:
+                    # refresh planner statistics for the indexes this connection used;
+                    # skipped if another process holds the write lock
+                    connection.execute("PRAGMA optimize")
+                except sqlite3.Error:
+                    pass
+                finally:
+                    connection.close()
+            self._connections.clear()
+            self._idle.clear()
+        self._local = threading.local()
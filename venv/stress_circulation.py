@@ -0,0 +1,176 @@
+import datetime
+import multiprocessing
+import os
+import queue
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import traceback
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import main
+from storage import Storage
+
+
+def populate(db, no_of_books, no_of_members, copies):
+    with db:
+        db.executemany("INSERT INTO books (id, title, author, genre, ISBN, no_of_copies) VALUES (?, ?, ?, ?, ?, ?)",
+                            [(i, f"Book {i}", "Author", "Fiction", 1000 + i, copies) for i in range(1, no_of_books + 1)])
+        db.executemany("INSERT INTO members (id, username, password, role) VALUES (?, ?, ?, ?)",
+                            [(i, f"member{i}", "x", "Member") for i in range(1, no_of_members + 1)])
+
+
+def run_worker(store, seed, no_of_books, no_of_members, no_of_ops, counts, errors):
+    rng = random.Random(seed)
+    today = datetime.date.today()
+
+    # an exception in a thread is only printed, so hand it back to be reported
+    try:
+        circulation = main.Circulation(store.connection())
+        for _ in range(no_of_ops):
+            # few books and members, so borrowers keep colliding on the last copies
+            book_id = rng.randint(1, no_of_books)
+            member_id = rng.randint(1, no_of_members)
+            if rng.random() < 0.6:
+                status = circulation.borrow(book_id, member_id, today)[0]
+            else:
+                loans = circulation.borrowed_books(member_id)
+                if loans:
+                    book_id = rng.choice(loans)[0]
+                status = circulation.return_book(book_id, member_id, today)[0]
+            counts[status] = counts.get(status, 0) + 1
+    except Exception:
+        errors.append(f"worker {seed}: {traceback.format_exc()}")
+    finally:
+        store.release()
+
+
+def run_process(db_path, seed, no_of_books, no_of_members, no_of_ops, threads_per_process, results):
+    store = Storage(db_path, pool_size=threads_per_process, timeout=60)
+    thread_counts = [{} for _ in range(threads_per_process)]
+    errors = []
+    threads = [threading.Thread(target=run_worker, args=(store, seed * 1000 + i, no_of_books, no_of_members, no_of_ops, thread_counts[i], errors))
+               for i in range(threads_per_process)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    counts = {}
+    for thread_count in thread_counts:
+        for status, count in thread_count.items():
+            counts[status] = counts.get(status, 0) + count
+    store.close_all()
+    results.put((counts, errors))
+
+
+def collect(workers, results, timeout):
+    # a worker that dies never reports, so poll for crashes instead of blocking on the queue
+    totals = {}
+    errors = []
+    pending = len(workers)
+    deadline = time.monotonic() + timeout
+    while pending:
+        try:
+            counts, worker_errors = results.get(timeout=1)
+        except queue.Empty:
+            crashed = [worker for worker in workers if worker.exitcode not in (None, 0)]
+            if crashed:
+                return None, None, f"{len(crashed)} worker(s) crashed, exit codes {[worker.exitcode for worker in crashed]}"
+            if all(worker.exitcode == 0 for worker in workers):
+                return None, None, f"{pending} worker(s) exited without reporting"
+            if time.monotonic() > deadline:
+                return None, None, f"{pending} worker(s) still running after {timeout}s"
+            continue
+        for status, count in counts.items():
+            totals[status] = totals.get(status, 0) + count
+        errors.extend(worker_errors)
+        pending -= 1
+    return totals, errors, None
+
+
+def check_invariants(db_path, copies):
+    errors = []
+    connection = sqlite3.connect(db_path)
+
+    for book_id, no_of_copies, active_loans in connection.execute(
+            "SELECT books.id, books.no_of_copies, "
+            "(SELECT COUNT(*) FROM transactions WHERE transactions.book_id = books.id AND due_date is not NULL) "
+            "FROM books"):
+        if no_of_copies < 0:
+            errors.append(f"book {book_id} has {no_of_copies} copies")
+        if no_of_copies + active_loans != copies:
+            errors.append(f"book {book_id}: {no_of_copies} copies + {active_loans} loans != {copies}")
+
+    for member_id, active_loans in connection.execute(
+            "SELECT user_id, COUNT(*) FROM transactions WHERE due_date is not NULL GROUP BY user_id"):
+        if active_loans > main.Circulation.book_borrow_limit:
+            errors.append(f"member {member_id} has {active_loans} active loans")
+
+    for member_id, book_id, active_loans in connection.execute(
+            "SELECT user_id, book_id, COUNT(*) FROM transactions WHERE due_date is not NULL "
+            "GROUP BY user_id, book_id HAVING COUNT(*) > 1"):
+        errors.append(f"member {member_id} holds {active_loans} loans of book {book_id}")
+
+    connection.close()
+    return errors
+
+
+if __name__ == '__main__':
+
+    processes = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    threads_per_process = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    no_of_ops = int(sys.argv[3]) if len(sys.argv) > 3 else 500
+    timeout = float(sys.argv[4]) if len(sys.argv) > 4 else 600
+    no_of_books, no_of_members, copies = 20, 50, 2
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix="library_stress_"), "library.sqlite")
+    store = Storage(db_path)
+    populate(store.connection(), no_of_books, no_of_members, copies)
+    store.close_all()
+
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=run_process, args=(db_path, seed, no_of_books, no_of_members, no_of_ops, threads_per_process, results))
+               for seed in range(processes)]
+
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    totals, thread_errors, failure = collect(workers, results, timeout)
+    if failure is not None:
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+        print(f"FAILED: {failure}")
+        sys.exit(1)
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+
+    total_ops = sum(totals.values())
+    print(f"{processes} processes x {threads_per_process} threads, {total_ops} operations in {elapsed:.2f}s "
+          f"({total_ops / elapsed:.0f} ops/sec)")
+    for status, count in sorted(totals.items()):
+        print(f"{status:<18} {count}")
+
+    if thread_errors:
+        print(f"FAILED: {len(thread_errors)} worker thread(s) raised")
+        for error in thread_errors[:5]:
+            print(error)
+        sys.exit(1)
+    expected_ops = processes * threads_per_process * no_of_ops
+    if total_ops != expected_ops:
+        print(f"FAILED: {total_ops} operations completed, expected {expected_ops}")
+        sys.exit(1)
+
+    errors = check_invariants(db_path, copies)
+    if errors:
+        print(f"FAILED: {len(errors)} invariant violations")
+        for error in errors[:20]:
+            print(f"  {error}")
+        sys.exit(1)
+    print("OK: stock and loan limits are consistent")